@@ -4,12 +4,27 @@ Complete administrative interface for managing elections
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
+import os
 import random
 import string
+import queue
+import shutil
+import threading
 from datetime import datetime
 from crypto_handler import CryptoHandler
 from config_manager import ConfigManager
+from tally_engine import LOG_SOURCE, count_incremental, load_votes, vote_source
+from vote_log import VoteLogReader
+from tally_report import (METHOD_NAMES, build_report, format_entry, format_footer, format_header, format_rounds,
+                          write_report)
+from tabulation import METHODS, PLURALITY
+from election_registry import ElectionRegistry
+from results_archive import write_archive
+
+
+AUTO_REFRESH_MS = 2000
+RESULTS_PAGE_SIZE = 50
 
 
 class AdminVotingSystem:
@@ -22,12 +37,21 @@ class AdminVotingSystem:
         # Initialize managers
         self.crypto = CryptoHandler()
         self.config_manager = ConfigManager()
+        self.registry = ElectionRegistry()
+        self.election = None
+        self.vote_log = VoteLogReader()
         
         # State variables
         self.candidates = []
         self.session_code = None
         self.encryption_key = None
         self.is_election_active = False
+        self.counting = False
+        self.counting_election = None
+        self.count_events = queue.Queue()
+        self.last_report = None
+        self.rendered_entries = 0
+        self.render_pending = False
         
         self.setup_ui()
         self.load_existing_election()
@@ -116,13 +140,41 @@ class AdminVotingSystem:
                  bg="#95a5a6", fg="white", font=("Arial", 9, "bold"), 
                  padx=15, pady=5, cursor="hand2").pack(side=tk.LEFT)
     
-  def build_election_control_section(self):
+    def build_election_control_section(self):
         """Build election control section"""
         frame = tk.LabelFrame(self.main_frame, text="⚙️ Election Control", 
                              font=("Arial", 13, "bold"), bg="white", 
                              padx=25, pady=20, relief=tk.GROOVE, bd=2)
         frame.pack(fill=tk.X, pady=(0, 15))
         
+        # Election selector
+        select_frame = tk.Frame(frame, bg="white")
+        select_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(select_frame, text="Election:", font=("Arial", 11), 
+                bg="white").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.election_selector = ttk.Combobox(select_frame, state="readonly", width=30)
+        self.election_selector.pack(side=tk.LEFT, padx=(0, 10))
+        self.election_selector.bind("<<ComboboxSelected>>",
+                                    lambda e: self.select_election(self.election_selector.get().split()[0]))
+        
+        tk.Button(select_frame, text="➕ New Election", command=self.new_election,
+                 bg="#27ae60", fg="white", font=("Arial", 9, "bold"), 
+                 padx=15, pady=5, cursor="hand2").pack(side=tk.LEFT)
+        
+        # Counting method, fixed once the election starts
+        method_frame = tk.Frame(frame, bg="white")
+        method_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        tk.Label(method_frame, text="Counting method:", font=("Arial", 11), 
+                bg="white").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.method_selector = ttk.Combobox(method_frame, state="readonly", width=30,
+                                            values=[METHOD_NAMES[m] for m in METHODS])
+        self.method_selector.set(METHOD_NAMES[PLURALITY])
+        self.method_selector.pack(side=tk.LEFT)
+        
         # Start button
         self.start_btn = tk.Button(frame, text="🚀 START ELECTION", 
                                    command=self.initialize_election,
@@ -166,6 +218,11 @@ class AdminVotingSystem:
         tk.Button(info_frame, text="🔄 Refresh", command=self.refresh_vote_count,
                  bg="#16a085", fg="white", font=("Arial", 9, "bold"), 
                  padx=15, pady=5, cursor="hand2").pack(side=tk.LEFT)
+        
+        self.auto_refresh = tk.BooleanVar(value=True)
+        tk.Checkbutton(info_frame, text="Auto-refresh", variable=self.auto_refresh,
+                      font=("Arial", 10), bg="white").pack(side=tk.LEFT, padx=(15, 0))
+        self.root.after(AUTO_REFRESH_MS, self.auto_refresh_tick)
     
     def build_results_section(self):
         """Build results section"""
@@ -178,21 +235,32 @@ class AdminVotingSystem:
         btn_frame = tk.Frame(frame, bg="white")
         btn_frame.pack(fill=tk.X, pady=(0, 15))
         
-        tk.Button(btn_frame, text="🔓 Decrypt & Count Votes", 
-                 command=self.decrypt_and_count,
-                 bg="#9b59b6", fg="white", font=("Arial", 12, "bold"), 
-                 padx=25, pady=10, cursor="hand2").pack(side=tk.LEFT, padx=(0, 10))
+        self.count_btn = tk.Button(btn_frame, text="🔓 Decrypt & Count Votes", 
+                                   command=self.decrypt_and_count,
+                                   bg="#9b59b6", fg="white", font=("Arial", 12, "bold"), 
+                                   padx=25, pady=10, cursor="hand2")
+        self.count_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        tk.Button(btn_frame, text="♻️ Full Recount", 
+                 command=lambda: self.decrypt_and_count(full=True),
+                 bg="#7f8c8d", fg="white", font=("Arial", 10, "bold"), 
+                 padx=15, pady=8, cursor="hand2").pack(side=tk.LEFT, padx=(0, 10))
         
         tk.Button(btn_frame, text="💾 Export Results", 
                  command=self.export_results,
                  bg="#34495e", fg="white", font=("Arial", 10, "bold"), 
                  padx=20, pady=8, cursor="hand2").pack(side=tk.LEFT)
         
+        self.count_progress_label = tk.Label(btn_frame, text="", font=("Arial", 10),
+                                             bg="white", fg="#7f8c8d")
+        self.count_progress_label.pack(side=tk.LEFT, padx=(15, 0))
+        
         # Results display
         self.results_text = scrolledtext.ScrolledText(frame, font=("Consolas", 10), 
                                                      height=15, wrap=tk.WORD,
                                                      bg="#f8f9fa")
         self.results_text.pack(fill=tk.BOTH, expand=True)
+        self.results_text.configure(yscrollcommand=self.on_results_scroll)
         self.results_text.insert(tk.END, "No results yet. Start an election and decrypt votes to see results.")
     
     def add_candidate(self):
@@ -254,6 +322,8 @@ class AdminVotingSystem:
         
         # Generate session code
         self.session_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        while self.registry.exists(self.session_code):
+            self.session_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
         
         # Generate encryption key
         self.encryption_key = self.crypto.generate_key()
@@ -261,6 +331,11 @@ class AdminVotingSystem:
         
         # Save configuration
         self.config_manager.save_election_config(self.session_code, self.candidates, key_string)
+        self.election = self.registry.create(self.session_code, self.candidates, key_string,
+                                             method=self.selected_method())
+        self.method_selector.config(state=tk.DISABLED)
+        self.vote_log = self.election.vote_reader()
+        self.refresh_election_list()
         
         # Update UI
         self.is_election_active = True
@@ -278,9 +353,16 @@ class AdminVotingSystem:
                           f"Share this code with all voters.\n"
                           f"They will need the 'election_config.json' file.")
     
+    def selected_method(self):
+        """Method key for the name shown in the counting method selector"""
+        return next((m for m in METHODS if METHOD_NAMES[m] == self.method_selector.get()), PLURALITY)
+    
     def end_election(self):
         """End the current election"""
         if messagebox.askyesno("Confirm", "End the current election?"):
+            if self.election:
+                self.election.set_status("ended")
+            self.refresh_election_list()
             self.is_election_active = False
             self.session_label.config(
                 text=f"Election Ended - Code: {self.session_code}",
@@ -291,133 +373,261 @@ class AdminVotingSystem:
     
     def refresh_vote_count(self):
         """Refresh the vote count display"""
-        count = self.config_manager.get_vote_count()
+        # The vote log keeps a running counter, so this is O(1); only the
+        # election that owns the shared per-file store, while its log is
+        # still empty, falls back to a storage scan.
+        if self.uses_vote_log():
+            count = self.vote_log.count()
+        else:
+            count = self.config_manager.get_vote_count()
         self.votes_count_label.config(text=f"Votes Received: {count}")
     
-    def decrypt_and_count(self):
-        """Decrypt all votes and count results"""
+    def uses_vote_log(self):
+        """True when the current election's votes are read from its vote log"""
+        return vote_source(self.config_manager, self.vote_log.directory, self.session_code) == LOG_SOURCE
+    
+    def auto_refresh_tick(self):
+        """Timer callback that keeps the live vote count current"""
+        # Only the vote log's O(1) counter is polled; the per-file storage
+        # scan is left to the manual refresh.
+        if self.auto_refresh.get() and self.uses_vote_log():
+            self.refresh_vote_count()
+        self.root.after(AUTO_REFRESH_MS, self.auto_refresh_tick)
+    
+    def decrypt_and_count(self, full=False):
+        """Decrypt new votes (or all of them when full) and count results in the background"""
+        if self.counting:
+            return
+        
         if not self.session_code:
             messagebox.showerror("Error", "No election has been initialized!")
             return
         
         # Load configuration
-        config = self.config_manager.load_election_config()
+        config = self.election.load_config() if self.election else None
         if not config:
             messagebox.showerror("Error", "Election configuration not found!")
             return
         
-        key = self.crypto.string_to_key(config["key"])
-        
-        # Initialize vote counts
-        vote_counts = {candidate: 0 for candidate in self.candidates}
-        total_votes = 0
-        invalid_votes = 0
-        
-        # Load and decrypt all votes
-        votes = self.config_manager.load_all_votes()
-        
-        for filename, encrypted_data in votes:
+        # Decrypt on a worker thread (which fans out to a process pool)
+        # so the Tk event loop keeps running while votes are counted.
+        self.counting = True
+        self.counting_election = self.election
+        self.count_btn.config(state=tk.DISABLED)
+        self.count_progress_label.config(text="Counting... 0 votes processed")
+        worker = threading.Thread(target=self.run_count,
+                                  args=(config["key"], self.session_code, list(self.candidates), full,
+                                        self.election, config.get("method", PLURALITY)),
+                                  daemon=True)
+        worker.start()
+        self.root.after(100, self.poll_count_events)
+    
+    def run_count(self, key_string, session_code, candidates, full, election, method):
+        """Worker thread body: count votes and report back through count_events"""
+        try:
+            source = vote_source(self.config_manager, election.vote_log_dir, session_code)
+            votes = load_votes(self.config_manager, election.vote_log_dir, session_code)
+            tally = count_incremental(votes, key_string, session_code, candidates, full=full,
+                                      directory=election.directory, method=method, source=source,
+                                      progress=lambda n: self.count_events.put(("progress", n)))
+            self.count_events.put(("done", tally))
+        except Exception as e:
+            self.count_events.put(("failed", e))
+    
+    def poll_count_events(self):
+        """Apply progress and completion events from the counting thread"""
+        while True:
             try:
-                vote_data = self.crypto.decrypt_vote(encrypted_data, key)
-                
-                if vote_data["session_code"] == self.session_code:
-                    candidate = vote_data["vote"]
-                    if candidate in vote_counts:
-                        vote_counts[candidate] += 1
-                        total_votes += 1
-                else:
-                    invalid_votes += 1
+                kind, payload = self.count_events.get_nowait()
+            except queue.Empty:
+                break
             
-            except Exception as e:
-                invalid_votes += 1
-                print(f"Error processing {filename}: {e}")
-        
-        # Save results
-        self.config_manager.save_results(self.session_code, total_votes, vote_counts)
+            if kind == "progress":
+                self.count_progress_label.config(text=f"Counting... {payload} votes processed")
+                continue
+            
+            self.counting = False
+            self.count_btn.config(state=tk.NORMAL)
+            if kind == "failed":
+                self.count_progress_label.config(text="")
+                messagebox.showerror("Error", f"Counting failed: {payload}")
+                return
+            
+            tally = payload
+            for filename, error in tally["errors"]:
+                print(f"Error processing {filename}: {error}")
+            self.count_progress_label.config(text=f"Processed {tally['processed']} new votes")
+            
+            # Save results
+            self.config_manager.save_results(self.session_code, tally["total_votes"], tally["vote_counts"])
+            
+            # Display results
+            self.display_results(tally)
+            self.counting_election.save_results(self.last_report, tally["vote_flags"])
+            return
         
-        # Display results
-        self.display_results(vote_counts, total_votes, invalid_votes)
+        self.root.after(100, self.poll_count_events)
     
-    def display_results(self, vote_counts, total_votes, invalid_votes):
+    def display_results(self, tally):
         """Display formatted results"""
-        self.results_text.delete(1.0, tk.END)
-        
-        # Header
-        self.results_text.insert(tk.END, "="*70 + "\n")
-        self.results_text.insert(tk.END, " "*20 + "ELECTION RESULTS\n")
-        self.results_text.insert(tk.END, "="*70 + "\n\n")
-        
-        self.results_text.insert(tk.END, f"Session Code: {self.session_code}\n")
-        self.results_text.insert(tk.END, f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        self.results_text.insert(tk.END, f"Total Valid Votes: {total_votes}\n")
-        if invalid_votes > 0:
-            self.results_text.insert(tk.END, f"Invalid Votes: {invalid_votes}\n")
-        self.results_text.insert(tk.END, "\n" + "="*70 + "\n\n")
-        
-        # Sort results
-        sorted_results = sorted(vote_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        # Display each candidate
-        for i, (candidate, votes) in enumerate(sorted_results, 1):
-            percentage = (votes / total_votes * 100) if total_votes > 0 else 0
-            
-            self.results_text.insert(tk.END, f"Rank {i}: {candidate}\n")
-            self.results_text.insert(tk.END, f"       Votes: {votes} ({percentage:.2f}%)\n")
-            self.results_text.insert(tk.END, f"       {'█' * int(percentage/2)}\n\n")
-        
-        # Winner declaration
-        if sorted_results and sorted_results[0][1] > 0:
-            winner = sorted_results[0][0]
-            winner_votes = sorted_results[0][1]
-            
-            self.results_text.insert(tk.END, "="*70 + "\n")
-            self.results_text.insert(tk.END, f"{'🏆 WINNER 🏆':^70}\n")
-            self.results_text.insert(tk.END, f"{winner:^70}\n")
-            self.results_text.insert(tk.END, f"{'with ' + str(winner_votes) + ' votes':^70}\n")
-            self.results_text.insert(tk.END, "="*70 + "\n")
+        report = build_report(self.session_code, tally)
+        self.show_report(report)
         
         messagebox.showinfo("Success", 
                           f"Results calculated successfully!\n\n"
-                          f"Total votes: {total_votes}\n"
-                          f"Winner: {sorted_results[0][0] if sorted_results else 'N/A'}")
+                          f"Total votes: {report['total_votes']}\n"
+                          f"Winner: {report['winner'] or 'N/A'}")
     
-    def export_results(self):
-        """Export results to a text file"""
-        content = self.results_text.get(1.0, tk.END)
+    def show_report(self, report):
+        """Replace the results panel with a report"""
+        self.last_report = report
+        self.rendered_entries = 0
         
-        if "No results yet" in content:
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, format_header(report))
+        self.render_more_results()
+    
+    def render_more_results(self):
+        """Append the next page of candidates with a single widget insert"""
+        self.render_pending = False
+        report = self.last_report
+        if report is None or self.rendered_entries >= len(report["ranking"]):
+            return
+        
+        start = self.rendered_entries
+        end = min(start + RESULTS_PAGE_SIZE, len(report["ranking"]))
+        chunk = "".join(format_entry(entry) for entry in report["ranking"][start:end])
+        if end == len(report["ranking"]):
+            chunk += format_rounds(report) + format_footer(report)
+        self.results_text.insert(tk.END, chunk)
+        self.rendered_entries = end
+    
+    def on_results_scroll(self, first, last):
+        """Scrollbar hook: render the next page once the user nears the end"""
+        self.results_text.vbar.set(first, last)
+        if float(last) > 0.9 and not self.render_pending and self.last_report is not None:
+            self.render_pending = True
+            self.root.after_idle(self.render_more_results)
+    
+    def export_results(self):
+        """Export results as text, CSV, JSON or the binary archive"""
+        if self.last_report is None:
             messagebox.showwarning("Warning", "No results to export!")
             return
         
-        filename = f"results_{self.session_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        filename = filedialog.asksaveasfilename(
+            title="Export Results",
+            initialfile=f"results_{self.session_code}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+            defaultextension=".txt",
+            filetypes=[("Text", "*.txt"), ("CSV", "*.csv"), ("JSON", "*.json"), ("Results archive", "*.wvr")],
+        )
+        if not filename:
+            return
         
-        with open(filename, 'w') as f:
-            f.write(content)
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".wvr":
+            # The saved archive also carries the per-vote flags from the count.
+            if self.election and os.path.exists(self.election.archive_path):
+                shutil.copyfile(self.election.archive_path, filename)
+            else:
+                write_archive(filename, self.last_report)
+        else:
+            fmt = {".csv": "csv", ".json": "json"}.get(extension, "text")
+            write_report(self.last_report, filename, fmt)
         
         messagebox.showinfo("Exported", f"Results exported to:\n{filename}")
     
+    def refresh_election_list(self):
+        """Fill the election selector from the registry"""
+        self.election_selector["values"] = [
+            f"{config['session_code']} ({config.get('status', 'active')})"
+            for config in self.registry.sessions()
+        ]
+        if self.session_code:
+            self.election_selector.set(
+                next((v for v in self.election_selector["values"] if v.split()[0] == self.session_code), ""))
+    
+    def new_election(self):
+        """Clear the form so another election can be set up next to the existing ones"""
+        if self.counting:
+            messagebox.showwarning("Warning", "Wait for the current count to finish!")
+            return
+        
+        self.election = None
+        self.session_code = None
+        self.candidates = []
+        self.is_election_active = False
+        self.vote_log = VoteLogReader()
+        self.candidates_listbox.delete(0, tk.END)
+        self.session_label.config(text="No active election", fg="#7f8c8d", bg="#ecf0f1")
+        self.start_btn.config(state=tk.NORMAL)
+        self.stop_btn.config(state=tk.DISABLED)
+        self.election_selector.set("")
+        self.method_selector.config(state="readonly")
+        self.method_selector.set(METHOD_NAMES[PLURALITY])
+        self.last_report = None
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, "No results yet. Start an election and decrypt votes to see results.")
+        self.refresh_vote_count()
+    
+    def select_election(self, session_code):
+        """Switch the whole window to another registered election"""
+        if self.counting:
+            messagebox.showwarning("Warning", "Wait for the current count to finish!")
+            self.refresh_election_list()
+            return
+        
+        self.election = self.registry.get(session_code)
+        config = self.election.load_config()
+        self.vote_log = self.election.vote_reader()
+        self.session_code = config["session_code"]
+        self.candidates = list(config["candidates"])
+        self.method_selector.set(METHOD_NAMES[config.get("method", PLURALITY)])
+        self.method_selector.config(state=tk.DISABLED)
+        
+        self.candidates_listbox.delete(0, tk.END)
+        for candidate in self.candidates:
+            self.candidates_listbox.insert(tk.END, candidate)
+        
+        self.is_election_active = config.get("status") == "active"
+        if self.is_election_active:
+            self.session_label.config(
+                text=f"🔑 SESSION CODE: {self.session_code}\n"
+                     f"(Loaded from previous session)",
+                fg="#f39c12", bg="#fef5e7"
+            )
+            self.stop_btn.config(state=tk.NORMAL)
+        else:
+            self.session_label.config(
+                text=f"Election Ended - Code: {self.session_code}",
+                fg="#e74c3c", bg="#fadbd8"
+            )
+            self.stop_btn.config(state=tk.DISABLED)
+        self.start_btn.config(state=tk.DISABLED)
+        
+        report = self.election.load_results()
+        if report:
+            self.show_report(report)
+        else:
+            self.last_report = None
+            self.results_text.delete(1.0, tk.END)
+            self.results_text.insert(tk.END, "No results yet. Start an election and decrypt votes to see results.")
+        
+        self.refresh_election_list()
+        self.refresh_vote_count()
+    
     def load_existing_election(self):
         """Load existing election if available"""
+        # Elections created before the registry existed only live in
+        # ConfigManager's single config; register it so it shows up too.
         config = self.config_manager.load_election_config()
-        
         if config:
-            self.session_code = config["session_code"]
-            self.candidates = config["candidates"]
-            
-            for candidate in self.candidates:
-                self.candidates_listbox.insert(tk.END, candidate)
-            
-            if config.get("status") == "active":
-                self.is_election_active = True
-                self.session_label.config(
-                    text=f"🔑 SESSION CODE: {self.session_code}\n"
-                         f"(Loaded from previous session)",
-                    fg="#f39c12", bg="#fef5e7"
-                )
-                self.start_btn.config(state=tk.DISABLED)
-                self.stop_btn.config(state=tk.NORMAL)
-            
-            self.refresh_vote_count()
+            self.registry.import_config(config)
+        
+        sessions = self.registry.sessions()
+        self.refresh_election_list()
+        if sessions:
+            self.select_election(sessions[0]["session_code"])
 
 
 def main():
@@ -0,0 +1,147 @@
+"""
+Admission
+Load shedding for the voting routes: a bounded in-flight write budget (503) and per-client token buckets (429)
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request, session
+
+
+class WriteBudget:
+    """Non-blocking cap on concurrent vote writes; excess requests are shed instead of queueing on SQLite"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class TokenBuckets:
+    """Per-client token buckets in one LRU map; the least recently seen client is evicted past max_clients.
+
+    Each client costs one dict entry holding a two-item list (tokens, last refill).
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self.evicted = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key):
+        """Spend one token; returns 0 when allowed, else the seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self.limited += 1
+            return (1 - bucket[0]) / self.rate
+
+
+class AdmissionControl:
+    """Guards the voting endpoints; rate limits apply to every guarded request, the write budget to POSTs that record votes.
+
+    Requests from a recognised session spend that session's bucket. Anything
+    else (starting a session, the one-shot ballot form) spends a bucket per
+    address, sized separately because one NAT or proxy can front a whole hall.
+    """
+
+    def __init__(self, rate_endpoints, write_endpoints, write_budget, rate, burst, max_clients,
+                 address_rate=0, address_burst=0, retry_after=1):
+        self.rate_endpoints = frozenset(rate_endpoints)
+        self.write_endpoints = frozenset(write_endpoints)
+        self.budget = WriteBudget(write_budget) if write_budget > 0 else None
+        self.buckets = TokenBuckets(rate, burst, max_clients) if rate > 0 else None
+        self.address_buckets = TokenBuckets(address_rate, address_burst, max_clients) if address_rate > 0 else None
+        self.retry_after = retry_after
+
+    def init_app(self, app):
+        if self.budget is None and self.buckets is None and self.address_buckets is None:
+            return
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _bucket(self):
+        # A session id only names a client once the server-side store knows it.
+        # Anything else (no cookie, a made-up or expired sid, signed-cookie
+        # sessions) is keyed by address, so dropping or rotating the cookie
+        # buys nothing beyond the address budget.
+        sid = getattr(session, "sid", None)
+        if sid and not getattr(session, "new", True):
+            return self.buckets, sid
+        return self.address_buckets, request.remote_addr or ""
+
+    def reject(self, status, message, retry_after):
+        """Shed response: JSON under /api/, plain text elsewhere, with Retry-After"""
+        if request.path.startswith("/api/"):
+            response = jsonify({"status": "error", "error": message})
+        else:
+            response = current_app.response_class(message + "\n", mimetype="text/plain")
+        response.status_code = status
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _admit(self):
+        endpoint = request.endpoint
+        if endpoint in self.rate_endpoints:
+            buckets, client = self._bucket()
+            wait = buckets.take(client) if buckets is not None else 0
+            if wait:
+                return self.reject(429, "Too many requests, please slow down.", wait)
+        if self.budget is not None and endpoint in self.write_endpoints and request.method == "POST":
+            if not self.budget.try_acquire():
+                return self.reject(503, "The server is busy recording votes, please retry.", self.retry_after)
+            g._write_admitted = True
+
+    def _release(self, exception):
+        if g.pop("_write_admitted", False):
+            self.budget.release()
+
+    def stats(self):
+        stats = {}
+        if self.budget is not None:
+            stats.update(writes_in_flight=self.budget.in_flight, writes_admitted=self.budget.admitted,
+                         writes_shed=self.budget.shed)
+        if self.buckets is not None:
+            stats.update(rate_limited=self.buckets.limited, clients_tracked=len(self.buckets),
+                         clients_evicted=self.buckets.evicted)
+        if self.address_buckets is not None:
+            stats.update(address_rate_limited=self.address_buckets.limited,
+                         addresses_tracked=len(self.address_buckets))
+        return stats
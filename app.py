@@ -1,26 +1,177 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, jsonify, Response, abort
+import io
 import os
+import atexit
+import functools
+import hmac
+import threading
+import vote_counter
+from ballot_queue import BallotCancelled, BallotWriter
+from results_cache import PageCache, ResultsCache
+from ballot_cache import (BallotCache, ballot_version, build_receipt, init_ballot_schema, load_ballot,
+                          validate_selections)
+from db_pool import ConnectionPool, settings_from_env
+from session_store import build_session_interface
+from results_stream import ResultsPublisher
+from instrumentation import Instrumentation
+from admission import AdmissionControl
+from ballot_import import BallotImportError, detect_format, import_ballot, read_rows, sample_rows
+from election_registry import ElectionRegistry
+from tally_report import METHOD_NAMES
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "change-this-secret")
 DATABASE = "wevote.db"
+# Ballot state lives server-side ("memory" or "sqlite"); "cookie" keeps Flask's signed cookie.
+SESSION_BACKEND = os.environ.get("WEVOTE_SESSION_BACKEND", "memory")
+SESSION_TTL = int(os.environ.get("WEVOTE_SESSION_TTL", "7200"))
+SESSION_DATABASE = os.environ.get("WEVOTE_SESSION_DB", "sessions.db")
+VOTE_SHARDS = int(os.environ.get("WEVOTE_VOTE_SHARDS", "8"))
+# "sync" commits every confirmed vote in the request; "group" hands it to the
+# background writer, which commits many voters in one transaction.
+DURABILITY = os.environ.get("WEVOTE_DURABILITY", "sync")
+# Seconds a request waits for the background writer to commit its ballot.
+WRITE_TIMEOUT = float(os.environ.get("WEVOTE_WRITE_TIMEOUT", "10"))
+RESULTS_TTL = float(os.environ.get("WEVOTE_RESULTS_TTL", "2"))
+# Per-request SQL timing and route latency histograms at /metrics; off by default.
+METRICS_ENABLED = os.environ.get("WEVOTE_METRICS", "0") == "1"
+# Admission control: concurrent vote writes before shedding with 503 (0 disables), and
+# per-client token buckets on the voting routes (requests/second, burst; 0 disables).
+WRITE_BUDGET = int(os.environ.get("WEVOTE_WRITE_BUDGET", "64"))
+RATE_LIMIT = float(os.environ.get("WEVOTE_RATE_LIMIT", "5"))
+RATE_BURST = int(os.environ.get("WEVOTE_RATE_BURST", "20"))
+RATE_CLIENTS = int(os.environ.get("WEVOTE_RATE_CLIENTS", "10000"))
+# Requests without a session yet (/start, the one-shot ballot) share one bucket per address,
+# so it is sized for a whole hall behind one NAT or proxy.
+ADDRESS_RATE_LIMIT = float(os.environ.get("WEVOTE_ADDRESS_RATE_LIMIT", "50"))
+ADDRESS_RATE_BURST = int(os.environ.get("WEVOTE_ADDRESS_RATE_BURST", "500"))
+# Counted elections from the admin tool, shown round by round at /results/<session_code>.
+ELECTIONS_ROOT = os.environ.get("WEVOTE_ELECTIONS_ROOT", "elections")
+# Bearer token for the /admin routes; when unset they only answer requests from this machine.
+ADMIN_TOKEN = os.environ.get("WEVOTE_ADMIN_TOKEN", "")
+
+session_interface = build_session_interface(SESSION_BACKEND, SESSION_TTL, SESSION_DATABASE)
+if session_interface is not None:
+    app.session_interface = session_interface
+
+results_cache = ResultsCache(vote_counter.tally_version, RESULTS_TTL)
+ballot_cache = BallotCache()
+page_cache = PageCache()
+metrics = Instrumentation(METRICS_ENABLED)
+metrics.init_app(app)
+admission = AdmissionControl(
+    rate_endpoints=("start", "vote", "confirm", "ballot", "api_ballot"),
+    write_endpoints=("confirm", "ballot", "api_ballot"),
+    write_budget=WRITE_BUDGET,
+    rate=RATE_LIMIT,
+    burst=RATE_BURST,
+    max_clients=RATE_CLIENTS,
+    address_rate=ADDRESS_RATE_LIMIT,
+    address_burst=ADDRESS_RATE_BURST,
+)
+admission.init_app(app)
+
+_writer = None
+_writer_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database != DATABASE:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DATABASE, **settings_from_env())
+        return _pool
+
+
+@atexit.register
+def close_pool():
+    # Registered before shutdown_writer, so atexit runs it after the writer drains.
+    if _pool is not None:
+        _pool.close_all()
+
+
+def connect_db():
+    return get_pool().connect()
 
 
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-        db.execute("PRAGMA foreign_keys = ON;")
+        pool = get_pool()
+        g._database_raw = pool.acquire()
+        g._database_pool = pool
+        db = g._database = metrics.instrument(g._database_raw)
     return db
 
 
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.failure is not None:
+            # A writer whose thread died is replaced rather than left to fail every vote.
+            _writer = BallotWriter(lambda: metrics.instrument(connect_db()), VOTE_SHARDS).start()
+        return _writer
+
+
+@atexit.register
+def shutdown_writer():
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+
+def record_votes(nominee_ids):
+    """Persist one voter's selections according to DURABILITY"""
+    if DURABILITY == "group":
+        writer = get_writer()
+        ticket = writer.submit(nominee_ids)
+        try:
+            ticket.wait(WRITE_TIMEOUT)
+        except TimeoutError:
+            # Withdraw it so a retry cannot count twice; a ballot already in a
+            # batch being written is waited for instead.
+            if writer.cancel(ticket):
+                raise BallotCancelled() from None
+            ticket.wait()
+    else:
+        db = get_db()
+        vote_counter.record_votes(db, nominee_ids, VOTE_SHARDS)
+        db.commit()
+        vote_counter.tally_version.bump()
+
+
+@app.errorhandler(BallotCancelled)
+def ballot_cancelled(error):
+    return admission.reject(503, "The server is busy recording votes, please retry.", admission.retry_after)
+
+
+def build_results():
+    pool = get_pool()
+    db = pool.acquire()
+    try:
+        return vote_counter.results_snapshot(metrics.instrument(db))
+    finally:
+        pool.release(db)
+
+
+def current_results():
+    return results_cache.get(build_results)
+
+
+results_publisher = ResultsPublisher(vote_counter.tally_version, current_results)
+
+
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, "_database", None)
+    db = getattr(g, "_database_raw", None)
     if db is not None:
-        db.close()
+        g._database_pool.release(db)
 
 
 def init_db():
@@ -45,6 +196,8 @@ def init_db():
         );
     """
     )
+    vote_counter.init_counter_schema(db)
+    init_ballot_schema(db)
     db.commit()
 
 
@@ -52,40 +205,62 @@ def seed_sample_ballot():
     db = get_db()
     c = db.execute("SELECT COUNT(*) as cnt FROM categories").fetchone()["cnt"]
     if c == 0:
-        categories = [
-            ("President", ["Alice", "Bob", "Charlie"]),
-            ("Secretary", ["Dana", "Eli"]),
-            ("Treasurer", ["Fay", "George"]),
-        ]
-        for idx, (cat, noms) in enumerate(categories):
-            cur = db.execute("INSERT INTO categories (name, ordering) VALUES (?, ?)", (cat, idx))
-            cat_id = cur.lastrowid
-            db.executemany(
-                "INSERT INTO nominees (category_id, name, votes) VALUES (?, ?, 0)",
-                [(cat_id, n) for n in noms],
-            )
-        db.commit()
+        import_ballot(db, sample_rows())
+        ballot_cache.invalidate()
+
+
+def startup():
+    init_db()
+    seed_sample_ballot()
+    get_ballot()
 
 
-def startup(): init_db() seed_sample_ballot()
+def get_ballot():
+    """The current ballot, checked against the stored version once per request"""
+    ballot = g.get("_ballot")
+    if ballot is None:
+        db = get_db()
+        ballot = g._ballot = ballot_cache.get(lambda: load_ballot(db), lambda: ballot_version(db))
+    return ballot
 
 
 def get_categories():
-    db = get_db()
-    return db.execute("SELECT id, name FROM categories ORDER BY ordering, id").fetchall()
+    return get_ballot().categories
 
 
 def get_nominees(category_id):
-    db = get_db()
-    return db.execute("SELECT id, name, votes FROM nominees WHERE category_id = ? ORDER BY id", (category_id,)).fetchall()
+    return get_ballot().nominees(category_id)
+
+
+def cached_page(key, render, cache_control, vary_cookie=False):
+    """Serve a page with a strong ETag built from key, answering If-None-Match with 304.
+
+    Pending flash messages are shown once, so those responses are rendered
+    fresh and not cached.
+    """
+    if session.get("_flashes"):
+        return render()
+    etag = "-".join(str(part) for part in key)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(page_cache.get(key, render))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    if vary_cookie:
+        response.vary.add("Cookie")
+    return response
 
 
 @app.route("/")
 def index():
-    if session.get("voted"):
-        return render_template("index.html", voted=True)
-    categories = get_categories()
-    return render_template("index.html", voted=False, categories=categories)
+    voted = bool(session.get("voted"))
+    ballot = get_ballot()
+    if voted:
+        render = lambda: render_template("index.html", voted=True)
+    else:
+        render = lambda: render_template("index.html", voted=False, categories=ballot.categories)
+    return cached_page(("index", int(voted), ballot.digest), render, "private, no-cache", vary_cookie=True)
 
 
 @app.route("/start", methods=("POST",))
@@ -116,8 +291,7 @@ def vote(index):
         flash("Invalid category index.", "danger")
         return redirect(url_for("index"))
     cat_id = int(order[index])
-    db = get_db()
-    category = db.execute("SELECT id, name FROM categories WHERE id = ?", (cat_id,)).fetchone()
+    category = get_ballot().category(cat_id)
     nominees = get_nominees(cat_id)
     if request.method == "POST":
         selected = request.form.get("nominee")
@@ -144,18 +318,17 @@ def confirm(index):
         flash("Invalid category index.", "danger")
         return redirect(url_for("index"))
     cat_id = int(order[index])
-    db = get_db()
-    category = db.execute("SELECT id, name FROM categories WHERE id = ?", (cat_id,)).fetchone()
+    ballot = get_ballot()
+    category = ballot.category(cat_id)
     nominee_id = session.get("selections", {}).get(str(cat_id))
     if nominee_id is None:
         flash("No selection found to confirm.", "warning")
         return redirect(url_for("vote", index=index))
-    nominee = db.execute("SELECT id, name FROM nominees WHERE id = ? AND category_id = ?", (int(nominee_id), cat_id)).fetchone()
+    nominee = ballot.nominee(int(nominee_id), cat_id)
     if request.method == "POST":
         action = request.form.get("action")
         if action == "confirm":
-            db.execute("UPDATE nominees SET votes = votes + 1 WHERE id = ? AND category_id = ?", (nominee["id"], cat_id))
-            db.commit()
+            record_votes([nominee["id"]])
             next_index = index + 1
             if next_index >= len(order):
                 session["voted"] = True
@@ -169,51 +342,166 @@ def confirm(index):
     return render_template("confirm.html", category=category, nominee=nominee, index=index, total=len(order))
 
 
+def submit_ballot(selections):
+    """Validate a whole ballot and commit every race in one transaction"""
+    nominee_ids, errors = validate_selections(get_ballot(), selections)
+    if errors:
+        return errors
+    record_votes(nominee_ids)
+    session["selections"] = {k: str(v) for k, v in selections.items()}
+    session["voted"] = True
+    return {}
+
+
+@app.route("/ballot", methods=("GET", "POST"))
+def ballot():
+    if session.get("voted"):
+        flash("You already voted in this session.", "info")
+        return redirect(url_for("index"))
+    categories = get_categories()
+    if not categories:
+        flash("No categories available.", "warning")
+        return redirect(url_for("index"))
+    if request.method == "POST":
+        selections = {str(c["id"]): request.form.get(f"nominee_{c['id']}") for c in categories}
+        errors = submit_ballot(selections)
+        if not errors:
+            flash("All votes recorded. Thank you!", "success")
+            return redirect(url_for("complete"))
+        for message in errors.values():
+            flash(message, "danger")
+    races = [(c, get_nominees(c["id"])) for c in categories]
+    return render_template("ballot.html", races=races, selected=request.form)
+
+
+@app.route("/api/ballot", methods=("POST",))
+def api_ballot():
+    if session.get("voted"):
+        return jsonify({"status": "error", "error": "You already voted in this session."}), 409
+    payload = request.get_json(silent=True) or {}
+    selections = payload.get("selections")
+    if not isinstance(selections, dict):
+        return jsonify({"status": "error", "error": "Expected a 'selections' object."}), 400
+    errors = submit_ballot({str(k): v for k, v in selections.items()})
+    if errors:
+        return jsonify({"status": "error", "errors": errors}), 400
+    return jsonify({"status": "ok", "picks": build_receipt(get_ballot(), session["selections"])})
+
+
 @app.route("/complete")
 def complete():
     voted = session.get("voted", False)
-    selections = session.get("selections", {})
-    db = get_db()
-    picks = []
-    for cat_id_str, nominee_id_str in selections.items():
-        try:
-            cat_id = int(cat_id_str)
-            nominee_id = int(nominee_id_str)
-        except ValueError:
-            continue
-        cat = db.execute("SELECT name FROM categories WHERE id = ?", (cat_id,)).fetchone()
-        nom = db.execute("SELECT name FROM nominees WHERE id = ?", (nominee_id,)).fetchone()
-        if cat and nom:
-            picks.append({"category": cat["name"], "nominee": nom["name"]})
+    picks = build_receipt(get_ballot(), session.get("selections", {}))
     return render_template("complete.html", voted=voted, picks=picks)
 
 
 @app.route("/results")
 def results():
-    db = get_db()
-    categories = db.execute("SELECT id, name FROM categories ORDER BY ordering, id").fetchall()
-    data = []
-    for cat in categories:
-        noms = db.execute("SELECT name, votes FROM nominees WHERE category_id = ? ORDER BY id", (cat["id"],)).fetchall()
-        total = sum([n["votes"] for n in noms])
-        items = []
-        for n in noms:
-            pct = (n["votes"] / total * 100) if total > 0 else 0
-            items.append({"name": n["name"], "votes": n["votes"], "pct": round(pct, 1)})
-        data.append({"category": cat["name"], "total": total, "nominees": items})
-    return render_template("results.html", data=data)
+    data, digest = results_cache.snapshot(build_results)
+    return cached_page(("results", digest), lambda: render_template("results.html", data=data), "no-cache")
+
+
+@app.route("/results/<session_code>")
+def election_results(session_code):
+    """Published tally for an admin-counted election, including runoff rounds, once voting has ended"""
+    registry = ElectionRegistry(ELECTIONS_ROOT)
+    try:
+        path = registry.results_path(session_code)
+        # Counts taken while voting is open are interim and stay private.
+        if registry.get(session_code).load_config().get("status") != "ended":
+            abort(404)
+        mtime = os.stat(path).st_mtime_ns
+    except (KeyError, OSError, ValueError):
+        abort(404)
+
+    def render():
+        report = registry.get(session_code).load_results()
+        method = report.get("method", "plurality")
+        return render_template("rounds.html", report=report, rounds=report.get("rounds", []),
+                               method_name=METHOD_NAMES.get(method, method))
+
+    return cached_page(("rounds", session_code, mtime), render, "no-cache")
+
+
+@app.route("/results/stream")
+def results_stream():
+    return Response(
+        results_publisher.stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    gauges = {f"wevote_db_pool_{k}": (f"Connection pool {k.replace('_', ' ')}.", v) for k, v in get_pool().stats().items()}
+    gauges["wevote_results_cache_hits"] = ("Results served from cache.", results_cache.hits)
+    gauges["wevote_results_cache_builds"] = ("Results snapshots built.", results_cache.builds)
+    gauges["wevote_results_subscribers"] = ("Open results streams.", results_publisher.subscriber_count())
+    gauges["wevote_tally_version"] = ("Tally version counter.", vote_counter.tally_version.value)
+    for name, value in admission.stats().items():
+        gauges[f"wevote_admission_{name}"] = (f"Admission control {name.replace('_', ' ')}.", value)
+    writer = _writer
+    if writer is not None:
+        gauges["wevote_writer_batches_committed"] = ("Group-commit batches written.", writer.batches_committed)
+        gauges["wevote_writer_ballots_committed"] = ("Ballots written by the group-commit writer.", writer.ballots_committed)
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+def admin_required(view):
+    """Allow the view only with the admin bearer token, or from localhost when no token is configured"""
+
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if ADMIN_TOKEN:
+            auth = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(auth.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+                abort(403)
+        elif request.remote_addr not in ("127.0.0.1", "::1"):
+            abort(403)
+        return view(*args, **kwargs)
+
+    return guarded
 
 
 @app.route("/admin/reset", methods=("POST",))
+@admin_required
 def admin_reset():
-    db = get_db()
-    db.execute("DELETE FROM nominees;")
-    db.execute("DELETE FROM categories;")
-    db.commit()
-    seed_sample_ballot()
+    import_ballot(get_db(), sample_rows(), replace=True)
+    ballot_cache.invalidate()
+    vote_counter.tally_version.bump()
     flash("Database reset and sample ballot seeded.", "success")
     return redirect(url_for("index"))
 
 
+@app.route("/admin/ballot/import", methods=("POST",))
+@admin_required
+def admin_import_ballot():
+    """Add to the ballot from an uploaded file or the request body; ?mode=replace drops the current ballot"""
+    upload = request.files.get("file")
+    try:
+        if upload is not None:
+            fmt = request.values.get("format") or detect_format(upload.filename)
+            stream = io.TextIOWrapper(upload.stream, encoding="utf-8", newline="")
+        else:
+            fmt = request.values.get("format") or {
+                "text/csv": "csv", "application/json": "json", "application/x-ndjson": "jsonl",
+            }.get(request.mimetype)
+            if fmt is None:
+                raise BallotImportError(["Send a 'file' upload or set 'format' to csv, json or jsonl."])
+            stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        categories, nominees = import_ballot(get_db(), read_rows(stream, fmt),
+                                             replace=request.values.get("mode") == "replace")
+    except BallotImportError as e:
+        return jsonify({"status": "error", "errors": e.errors}), 400
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "errors": [f"Could not parse the ballot file: {e}"]}), 400
+    ballot_cache.invalidate()
+    vote_counter.tally_version.bump()
+    return jsonify({"status": "ok", "categories": categories, "nominees": nominees})
+
+
 if __name__ == "__main__":
+    with app.app_context():
+        startup()
     app.run(debug=True)
@@ -0,0 +1,146 @@
+"""
+ASGI
+ASGI entry point for the voting app, e.g. ``uvicorn asgi:asgi_app``
+
+Each request runs the Flask (WSGI) app on its own thread from a pool of
+WEVOTE_THREADS (default 32) per worker process, and the response is streamed
+back to the event loop chunk by chunk. Requests therefore run concurrently,
+and an open /results/stream subscriber ties up one pool thread until it
+disconnects, not the whole worker. Use it together with group durability,
+so confirmed votes queue for the single background writer instead of
+contending for SQLite's write lock.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from app import app
+
+THREADS = int(os.environ.get("WEVOTE_THREADS", "32"))
+
+_executor = ThreadPoolExecutor(THREADS, thread_name_prefix="wevote-asgi")
+
+
+def build_environ(scope, body):
+    """PEP 3333 environ for an ASGI http scope and its buffered request body"""
+    script_name = scope.get("root_path", "").encode("utf8").decode("latin1")
+    path_info = scope["path"].encode("utf8").decode("latin1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 0),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin1")
+        if key in environ:
+            value = environ[key] + ("; " if key == "HTTP_COOKIE" else ",") + value
+        environ[key] = value
+    return environ
+
+
+def _run(environ, send, loop, disconnected):
+    """Pool thread: call the WSGI app and hand each chunk of its response to the event loop"""
+    start = None
+    started = False
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def write(data):
+        nonlocal started
+        if not started:
+            started = True
+            send_sync(start)
+        if data:
+            send_sync({"type": "http.response.body", "body": data, "more_body": True})
+
+    def start_response(status, headers, exc_info=None):
+        nonlocal start
+        if exc_info and started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        start = {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+        }
+        return write
+
+    result = app(environ, start_response)
+    try:
+        for data in result:
+            if disconnected.is_set():
+                return
+            write(data)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    if not disconnected.is_set():
+        write(b"")
+        send_sync({"type": "http.response.body"})
+
+
+async def _watch_disconnect(receive, disconnected):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    disconnected.set()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        raise ValueError(f"unsupported ASGI scope type: {scope['type']}")
+    with SpooledTemporaryFile(max_size=65536) as body:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        loop = asyncio.get_running_loop()
+        # A streaming response stops at its next chunk once the client has gone.
+        disconnected = threading.Event()
+        watcher = loop.create_task(_watch_disconnect(receive, disconnected))
+        try:
+            await loop.run_in_executor(_executor, _run, build_environ(scope, body), send, loop, disconnected)
+        finally:
+            watcher.cancel()
@@ -0,0 +1,152 @@
+"""
+Ballot Cache
+Immutable in-process copy of the ballot structure (categories and nominees)
+"""
+
+import hashlib
+import threading
+from types import MappingProxyType
+
+
+class Ballot:
+    """Read-only view of the categories and nominees on the ballot"""
+
+    def __init__(self, category_rows, nominee_rows):
+        self.categories = tuple(
+            MappingProxyType({"id": row["id"], "name": row["name"]}) for row in category_rows
+        )
+        self._category_by_id = {c["id"]: c for c in self.categories}
+        by_category = {c["id"]: [] for c in self.categories}
+        self._nominee_by_id = {}
+        for row in nominee_rows:
+            nominee = MappingProxyType({"id": row["id"], "name": row["name"], "category_id": row["category_id"]})
+            self._nominee_by_id[nominee["id"]] = nominee
+            by_category.setdefault(nominee["category_id"], []).append(nominee)
+        self._nominees_by_category = {cat_id: tuple(noms) for cat_id, noms in by_category.items()}
+        # Content digest, so pages built from the ballot get the same ETag in every worker.
+        self.digest = hashlib.blake2b(
+            repr([(dict(c), [dict(n) for n in self.nominees(c["id"])]) for c in self.categories]).encode(),
+            digest_size=12,
+        ).hexdigest()
+
+    def category(self, category_id):
+        return self._category_by_id.get(category_id)
+
+    def nominees(self, category_id):
+        return self._nominees_by_category.get(category_id, ())
+
+    def nominee(self, nominee_id, category_id=None):
+        """Look up a nominee, optionally requiring it to belong to category_id"""
+        nominee = self._nominee_by_id.get(nominee_id)
+        if nominee is None or (category_id is not None and nominee["category_id"] != category_id):
+            return None
+        return nominee
+
+
+def parse_id(raw):
+    """Integer id from a form or JSON value; None for anything but a str or a non-bool int"""
+    if isinstance(raw, bool) or not isinstance(raw, (str, int)):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+def build_receipt(ballot, selections):
+    """Resolve {category_id: nominee_id} selections to category and nominee names"""
+    picks = []
+    for cat_id_str, nominee_id_str in selections.items():
+        cat_id = parse_id(cat_id_str)
+        nominee_id = parse_id(nominee_id_str)
+        if cat_id is None or nominee_id is None:
+            continue
+        cat = ballot.category(cat_id)
+        nom = ballot.nominee(nominee_id, cat_id)
+        if cat and nom:
+            picks.append({"category": cat["name"], "nominee": nom["name"]})
+    return picks
+
+
+def validate_selections(ballot, selections):
+    """Check a whole ballot in one pass.
+
+    Returns (nominee_ids, errors) where errors maps category id to a message;
+    every category on the ballot needs exactly one valid nominee.
+    """
+    nominee_ids = []
+    errors = {}
+    for cat in ballot.categories:
+        raw = selections.get(str(cat["id"]))
+        if raw is None or raw == "":
+            errors[str(cat["id"])] = f"Please select a nominee for '{cat['name']}'."
+            continue
+        nominee_id = parse_id(raw)
+        nominee = None if nominee_id is None else ballot.nominee(nominee_id, cat["id"])
+        if nominee is None:
+            errors[str(cat["id"])] = f"Invalid nominee for '{cat['name']}'."
+            continue
+        nominee_ids.append(nominee["id"])
+    known = {str(cat["id"]) for cat in ballot.categories}
+    for key in selections:
+        if key not in known:
+            errors[key] = "Unknown category."
+    return nominee_ids, errors
+
+
+def init_ballot_schema(db):
+    """Create the single-row ballot version counter bumped by every ballot import"""
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ballot_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+    """
+    )
+    db.execute("INSERT OR IGNORE INTO ballot_version (id, version) VALUES (1, 0);")
+
+
+def bump_ballot_version(db):
+    """Mark the ballot as changed; the caller owns the transaction"""
+    db.execute("UPDATE ballot_version SET version = version + 1 WHERE id = 1;")
+
+
+def ballot_version(db):
+    return db.execute("SELECT version FROM ballot_version WHERE id = 1").fetchone()[0]
+
+
+def load_ballot(db):
+    """Read the full ballot structure from the database"""
+    categories = db.execute("SELECT id, name FROM categories ORDER BY ordering, id").fetchall()
+    nominees = db.execute("SELECT id, category_id, name FROM nominees ORDER BY id").fetchall()
+    return Ballot(categories, nominees)
+
+
+class BallotCache:
+    """Holds the loaded ballot until the stored ballot version changes.
+
+    ``version()`` reads one row, so it is checked on every use; an import in
+    any worker or from the CLI is picked up by all of them on their next
+    request. invalidate() drops this process's copy straight away.
+    """
+
+    def __init__(self):
+        self._ballot = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, load, version):
+        current = version()
+        ballot = self._ballot
+        if ballot is not None and self._version == current:
+            return ballot
+        with self._lock:
+            if self._ballot is None or self._version != current:
+                self._ballot = load()
+                self._version = current
+            return self._ballot
+
+    def invalidate(self):
+        with self._lock:
+            self._ballot = None
@@ -0,0 +1,206 @@
+"""
+Ballot Import
+Bulk load of categories and nominees from CSV, JSON or JSON Lines in one transaction
+
+CSV needs ``category`` and ``nominee`` columns, one row per nominee. JSON is a
+list of ``{"name": ..., "nominees": [...]}`` objects (or ``{"categories": [...]}``).
+JSON Lines holds one such category object, or one ``{"category", "nominee"}``
+row, per line. Categories keep the order in which they first appear.
+
+Usage: python ballot_import.py BALLOT_FILE [--database wevote.db] [--format csv|json|jsonl] [--append]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+
+from ballot_cache import bump_ballot_version
+
+FORMATS = ("csv", "json", "jsonl")
+
+SAMPLE_BALLOT = (
+    ("President", ("Alice", "Bob", "Charlie")),
+    ("Secretary", ("Dana", "Eli")),
+    ("Treasurer", ("Fay", "George")),
+)
+
+
+class BallotImportError(ValueError):
+    """The ballot file was rejected; nothing was written"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if extension == "ndjson":
+        return "jsonl"
+    if extension not in FORMATS:
+        raise BallotImportError([f"Cannot tell the format of '{filename}'; use csv, json or jsonl."])
+    return extension
+
+
+def _category_rows(obj, where):
+    if not isinstance(obj, dict):
+        raise BallotImportError([f"{where}: expected an object, got {type(obj).__name__}."])
+    name = obj.get("name", obj.get("category"))
+    if "nominees" in obj:
+        nominees = obj["nominees"]
+        if not isinstance(nominees, list):
+            raise BallotImportError([f"{where}: 'nominees' must be a list of names."])
+        for nominee in nominees:
+            yield name, nominee
+    else:
+        yield name, obj.get("nominee")
+
+
+def read_rows(stream, fmt):
+    """Yield (category, nominee) pairs from a text stream.
+
+    CSV and JSON Lines are read line by line; a JSON document has to be
+    parsed whole, so prefer JSON Lines for very large ballots. Structural
+    problems raise BallotImportError naming the line or item.
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield row.get("category"), row.get("nominee")
+    elif fmt == "jsonl":
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    obj = json.loads(line)
+                except ValueError as e:
+                    raise BallotImportError([f"Line {number}: invalid JSON ({e})."]) from None
+                yield from _category_rows(obj, f"Line {number}")
+    elif fmt == "json":
+        try:
+            data = json.load(stream)
+        except ValueError as e:
+            raise BallotImportError([f"Invalid JSON ({e})."]) from None
+        if isinstance(data, dict):
+            data = data.get("categories", [])
+        if not isinstance(data, list):
+            raise BallotImportError(["Expected a list of categories."])
+        for number, obj in enumerate(data, 1):
+            yield from _category_rows(obj, f"Item {number}")
+    else:
+        raise BallotImportError([f"Unknown ballot format: {fmt}"])
+
+
+def sample_rows():
+    for category, nominees in SAMPLE_BALLOT:
+        for nominee in nominees:
+            yield category, nominee
+
+
+def collect(rows, existing=None):
+    """Group rows by category and check them before anything touches the database.
+
+    ``existing`` maps category name to the nominee names it already has (for
+    append imports). Returns an ordered {category: [nominee, ...]} dict.
+    """
+    existing = existing or {}
+    ballot = {}
+    seen = {}
+    errors = []
+    for line, (category, nominee) in enumerate(rows, 1):
+        category = (category or "").strip() if isinstance(category, str) else ""
+        nominee = (nominee or "").strip() if isinstance(nominee, str) else ""
+        if not category or not nominee:
+            errors.append(f"Row {line}: category and nominee are both required.")
+            continue
+        names = seen.get(category)
+        if names is None:
+            names = seen[category] = {n.casefold() for n in existing.get(category, ())}
+            ballot[category] = []
+        if nominee.casefold() in names:
+            errors.append(f"Row {line}: duplicate nominee '{nominee}' in '{category}'.")
+            continue
+        names.add(nominee.casefold())
+        ballot[category].append(nominee)
+        if len(errors) >= 50:
+            break
+    if errors:
+        raise BallotImportError(errors)
+    if not ballot:
+        raise BallotImportError(["The ballot file has no nominees."])
+    return ballot
+
+
+def import_ballot(db, rows, replace=True):
+    """Write a ballot in a single transaction; rolls back and raises BallotImportError on bad input.
+
+    ``replace`` drops the current ballot (and its votes) first; otherwise
+    nominees are added to existing categories of the same name and new
+    categories go after the current ones. Returns (categories, nominees) added.
+    """
+    try:
+        existing = {}
+        if not replace:
+            for row in db.execute(
+                "SELECT c.name AS category, n.name AS nominee FROM categories c "
+                "LEFT JOIN nominees n ON n.category_id = c.id"
+            ):
+                existing.setdefault(row["category"], []).append(row["nominee"] or "")
+        ballot = collect(rows, existing)
+
+        if replace:
+            db.execute("DELETE FROM categories;")
+        category_ids = {
+            row["name"]: row["id"] for row in db.execute("SELECT id, name FROM categories")
+        }
+        start = db.execute("SELECT COALESCE(MAX(ordering) + 1, 0) AS next FROM categories").fetchone()["next"]
+        new_categories = [name for name in ballot if name not in category_ids]
+        db.executemany(
+            "INSERT INTO categories (name, ordering) VALUES (?, ?)",
+            [(name, start + i) for i, name in enumerate(new_categories)],
+        )
+        if new_categories:
+            for row in db.execute("SELECT id, name FROM categories WHERE ordering >= ?", (start,)):
+                category_ids[row["name"]] = row["id"]
+        db.executemany(
+            "INSERT INTO nominees (category_id, name, votes) VALUES (?, ?, 0)",
+            ((category_ids[category], name) for category, names in ballot.items() for name in names),
+        )
+        bump_ballot_version(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(new_categories), sum(len(names) for names in ballot.values())
+
+
+def import_file(db, path, fmt=None, replace=True):
+    with open(path, encoding="utf-8", newline="") as f:
+        return import_ballot(db, read_rows(f, fmt or detect_format(path)), replace)
+
+
+def main():
+    from db_pool import ConnectionPool, settings_from_env
+
+    parser = argparse.ArgumentParser(description="Load categories and nominees into the voting database")
+    parser.add_argument("ballot_file", help="CSV, JSON or JSON Lines ballot")
+    parser.add_argument("--database", default="wevote.db", help="SQLite database used by the web app")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--append", action="store_true", help="add to the current ballot instead of replacing it")
+    args = parser.parse_args()
+
+    db = ConnectionPool(args.database, **settings_from_env()).connect()
+    try:
+        categories, nominees = import_file(db, args.ballot_file, args.format, replace=not args.append)
+    except BallotImportError as e:
+        parser.exit(1, "\n".join(e.errors) + "\n")
+    except sqlite3.OperationalError as e:
+        parser.exit(1, f"{args.database}: {e} (start the web app once to create the schema)\n")
+    finally:
+        db.close()
+    # Running web workers see the bumped ballot version and reload on their next request.
+    print(f"Imported {nominees} nominees in {categories} new categories into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Ballot Queue
+Write-behind queue that group-commits confirmed votes in batched transactions
+"""
+
+import queue
+import threading
+import time
+
+import vote_counter
+
+
+class BallotCancelled(Exception):
+    """The ballot was withdrawn from the queue before its batch was written; nothing was recorded"""
+
+
+class BallotTicket:
+    """Handle for an enqueued ballot; wait() returns once its batch is committed"""
+
+    def __init__(self, nominee_ids):
+        self.nominee_ids = list(nominee_ids)
+        self.error = None
+        # Guarded by the writer's claim lock: a ticket is either claimed for
+        # a batch or cancelled, never both.
+        self.claimed = False
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def resolve(self, error=None):
+        if self._done.is_set():
+            return
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("ballot was not committed in time")
+        if self.error is not None:
+            raise self.error
+
+
+class BallotWriter:
+    """Background writer that flushes queued ballots when a batch fills or the interval elapses"""
+
+    def __init__(self, connect, shards, batch_size=256, flush_interval=0.005):
+        self.connect = connect
+        self.shards = shards
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.batches_committed = 0
+        self.ballots_committed = 0
+        self._queue = queue.Queue()
+        # Set when the writer thread died; pending and new ballots fail with it.
+        self.failure = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="ballot-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, nominee_ids):
+        """Queue one voter's selections; they are committed together in the next batch"""
+        self._check_open()
+        ticket = BallotTicket(nominee_ids)
+        self._queue.put(ticket)
+        # The writer may have stopped or died between the check and the put,
+        # after its last drain; fail whatever it will never pick up.
+        if self._stopping.is_set() or self.failure is not None:
+            self._fail_pending(self.failure or RuntimeError("ballot writer is shutting down"))
+        return ticket
+
+    def cancel(self, ticket):
+        """Withdraw a queued ballot; False if its batch is already being written (wait for that instead)"""
+        with self._claim_lock:
+            if ticket.claimed:
+                return False
+            ticket.cancelled = True
+        ticket.resolve(BallotCancelled())
+        return True
+
+    def _check_open(self):
+        if self.failure is not None:
+            raise RuntimeError("ballot writer failed") from self.failure
+        if self._stopping.is_set():
+            raise RuntimeError("ballot writer is shutting down")
+
+    def _fail_pending(self, error):
+        while True:
+            try:
+                self._queue.get_nowait().resolve(error)
+            except queue.Empty:
+                return
+
+    def stop(self, timeout=None):
+        """Flush everything already queued, then stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+
+    def _collect(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, db, batch):
+        with self._claim_lock:
+            batch = [ticket for ticket in batch if not ticket.cancelled]
+            for ticket in batch:
+                ticket.claimed = True
+        if not batch:
+            return
+        try:
+            vote_counter.record_votes(db, [n for ticket in batch for n in ticket.nominee_ids], self.shards)
+            db.commit()
+        except Exception as e:
+            try:
+                db.rollback()
+            finally:
+                for ticket in batch:
+                    ticket.resolve(e)
+            return
+        vote_counter.tally_version.bump()
+        self.batches_committed += 1
+        self.ballots_committed += len(batch)
+        for ticket in batch:
+            ticket.resolve()
+
+    def _run(self):
+        batch = []
+        try:
+            db = self.connect()
+            try:
+                while not (self._stopping.is_set() and self._queue.empty()):
+                    batch = self._collect()
+                    if batch:
+                        self._flush(db, batch)
+                leftover = []
+                while not self._queue.empty():
+                    leftover.append(self._queue.get_nowait())
+                if leftover:
+                    batch = leftover
+                    self._flush(db, leftover)
+            finally:
+                db.close()
+        except Exception as e:
+            # Never leave a voter waiting on a writer that is gone.
+            self.failure = e
+            for ticket in batch:
+                ticket.resolve(e)
+            self._fail_pending(e)
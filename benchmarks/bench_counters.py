@@ -0,0 +1,90 @@
+"""
+Counter Benchmark
+Compares single-row vote increments against sharded counters under concurrent voters
+
+Usage: python benchmarks/bench_counters.py [--voters 16] [--votes 200] [--shards 1,4,8,16]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vote_counter  # noqa: E402
+
+
+def build_database(path):
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON;")
+    db.execute("CREATE TABLE categories (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, ordering INTEGER NOT NULL DEFAULT 0);")
+    db.execute(
+        "CREATE TABLE nominees (id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER NOT NULL, "
+        "name TEXT NOT NULL, votes INTEGER NOT NULL DEFAULT 0, "
+        "FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE);"
+    )
+    vote_counter.init_counter_schema(db)
+    db.execute("INSERT INTO categories (name) VALUES ('President')")
+    db.execute("INSERT INTO nominees (category_id, name) VALUES (1, 'Alice')")
+    db.commit()
+    db.close()
+
+
+def run(path, voters, votes_per_voter, shards):
+    """Drive ``voters`` threads, each committing one vote at a time; shards=0 means the legacy single row"""
+    errors = []
+    barrier = threading.Barrier(voters)
+
+    def voter():
+        db = sqlite3.connect(path, timeout=30)
+        barrier.wait()
+        for _ in range(votes_per_voter):
+            try:
+                if shards:
+                    vote_counter.record_votes(db, [1], shards)
+                else:
+                    db.execute("UPDATE nominees SET votes = votes + 1 WHERE id = 1")
+                db.commit()
+            except sqlite3.OperationalError as e:
+                db.rollback()
+                errors.append(e)
+        db.close()
+
+    threads = [threading.Thread(target=voter) for _ in range(voters)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    db = sqlite3.connect(path)
+    counted = vote_counter.nominee_totals(db, 1)[0][2]
+    db.close()
+    return elapsed, counted, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--voters", type=int, default=16)
+    parser.add_argument("--votes", type=int, default=200, help="votes per voter")
+    parser.add_argument("--shards", default="1,4,8,16", help="comma separated shard counts to try")
+    args = parser.parse_args()
+
+    layouts = [0] + [int(s) for s in args.shards.split(",") if s]
+    print(f"{'layout':<12}{'votes/sec':>12}{'counted':>10}{'errors':>8}")
+    for shards in layouts:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            build_database(path)
+            elapsed, counted, errors = run(path, args.voters, args.votes, shards)
+        label = f"{shards} shards" if shards else "single row"
+        print(f"{label:<12}{counted / elapsed:>12.0f}{counted:>10}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Load Test
+Drives simulated voters and results readers through the Flask voting flow against a temporary database
+
+Admission control (rate limits and the write budget) is off unless --admission is given, so the
+numbers measure the voting path itself; the run fails if any vote was shed or lost.
+
+Usage: python benchmarks/load_test.py [--mode client|server] [--voters 50] [--concurrency 16] [--readers 4]
+       [--admission]
+"""
+
+import argparse
+import http.client
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import got_request_exception  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import app as wevote  # noqa: E402
+
+
+class TestClientDriver:
+    """One voter's browser, backed by the Flask test client"""
+
+    def __init__(self, base_url=None):
+        self.client = wevote.app.test_client()
+
+    def request(self, method, path, data=None):
+        return self.client.open(path, method=method, data=data).status_code
+
+
+class HttpDriver:
+    """One voter's browser talking HTTP to the threaded local server"""
+
+    def __init__(self, base_url):
+        host, port = base_url.split(":")
+        self.conn = http.client.HTTPConnection(host, int(port), timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, data=None):
+        headers = {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        set_cookie = response.getheader("Set-Cookie")
+        if set_cookie:
+            self.cookie = set_cookie.split(";", 1)[0]
+        return response.status
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.failures = {}
+        self.shed = {}
+        self.lock_errors = 0
+        self._lock = threading.Lock()
+
+    def timed(self, driver, route, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            status = driver.request(method, path, data)
+        except Exception:
+            status = 599
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            if status in (429, 503):
+                self.shed[route] = self.shed.get(route, 0) + 1
+            elif status >= 500:
+                self.failures[route] = self.failures.get(route, 0) + 1
+        return status
+
+    def on_exception(self, sender, exception, **extra):
+        if isinstance(exception, sqlite3.OperationalError) and "locked" in str(exception):
+            with self._lock:
+                self.lock_errors += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_voter(driver, recorder, races):
+    recorder.timed(driver, "start", "POST", "/start")
+    for i, nominee_ids in enumerate(races):
+        recorder.timed(driver, "vote", "GET", f"/vote/{i}")
+        recorder.timed(driver, "vote", "POST", f"/vote/{i}", {"nominee": str(random.choice(nominee_ids))})
+        recorder.timed(driver, "confirm", "POST", f"/confirm/{i}", {"action": "confirm"})
+    recorder.timed(driver, "complete", "GET", "/complete")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("client", "server"), default="client",
+                        help="Flask test client in threads, or HTTP against a threaded local server")
+    parser.add_argument("--voters", type=int, default=50, help="total simulated voters")
+    parser.add_argument("--concurrency", type=int, default=16, help="voters in flight at once")
+    parser.add_argument("--readers", type=int, default=4, help="threads polling /results while voting runs")
+    parser.add_argument("--durability", choices=("sync", "group"), default=wevote.DURABILITY)
+    parser.add_argument("--admission", action="store_true",
+                        help="keep the app's rate limits and write budget (WEVOTE_RATE_*, WEVOTE_WRITE_BUDGET)")
+    args = parser.parse_args()
+
+    if not args.admission:
+        wevote.admission.budget = wevote.admission.buckets = wevote.admission.address_buckets = None
+
+    tmp = tempfile.TemporaryDirectory()
+    wevote.DATABASE = os.path.join(tmp.name, "loadtest.db")
+    wevote.DURABILITY = args.durability
+    with wevote.app.app_context():
+        wevote.startup()
+        races = [[n["id"] for n in wevote.get_nominees(c["id"])] for c in wevote.get_categories()]
+
+    recorder = Recorder()
+    got_request_exception.connect(recorder.on_exception, wevote.app)
+
+    server = None
+    base_url = None
+    driver_class = TestClientDriver
+    if args.mode == "server":
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, wevote.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"127.0.0.1:{server.server_port}"
+        driver_class = HttpDriver
+
+    remaining = list(range(args.voters))
+    remaining_lock = threading.Lock()
+    voting_done = threading.Event()
+
+    def voter_worker():
+        while True:
+            with remaining_lock:
+                if not remaining:
+                    return
+                remaining.pop()
+            run_voter(driver_class(base_url), recorder, races)
+
+    def reader_worker():
+        driver = driver_class(base_url)
+        while not voting_done.is_set():
+            recorder.timed(driver, "results", "GET", "/results")
+
+    readers = [threading.Thread(target=reader_worker) for _ in range(args.readers)]
+    voters = [threading.Thread(target=voter_worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in readers + voters:
+        t.start()
+    for t in voters:
+        t.join()
+    elapsed = time.perf_counter() - started
+    voting_done.set()
+    for t in readers:
+        t.join()
+    if server is not None:
+        server.shutdown()
+    wevote.shutdown_writer()
+
+    with wevote.app.app_context():
+        counted = sum(cat["total"] for cat in wevote.build_results())
+    wevote.close_pool()
+    tmp.cleanup()
+
+    print(f"mode={args.mode} durability={args.durability} voters={args.voters} "
+          f"concurrency={args.concurrency} readers={args.readers} admission={'on' if args.admission else 'off'}")
+    print(f"votes committed: {counted} in {elapsed:.2f}s -> {counted / elapsed:.1f} votes/sec")
+    print(f"lock-contention errors: {recorder.lock_errors}")
+    print(f"{'route':<10}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'shed':>6}{'5xx':>6}")
+    for route in ("start", "vote", "confirm", "complete", "results"):
+        values = recorder.latencies.get(route)
+        if not values:
+            continue
+        print(f"{route:<10}{len(values):>10}{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 99) * 1000:>10.2f}{recorder.shed.get(route, 0):>6}"
+              f"{recorder.failures.get(route, 0):>6}")
+
+    expected = args.voters * len(races)
+    shed = sum(recorder.shed.values())
+    if counted != expected or shed:
+        sys.exit(f"FAILED: {counted} of {expected} votes committed, {shed} requests shed; "
+                 f"the votes/sec above does not measure the voting path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Database Pool
+Persistent, WAL-tuned SQLite connections shared across requests
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up in time"""
+
+
+def settings_from_env():
+    """Read pool and PRAGMA settings from WEVOTE_DB_* environment variables"""
+    return {
+        "size": int(os.environ.get("WEVOTE_DB_POOL_SIZE", "8")),
+        "timeout": float(os.environ.get("WEVOTE_DB_POOL_TIMEOUT", "30")),
+        "journal_mode": os.environ.get("WEVOTE_DB_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("WEVOTE_DB_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout_ms": int(os.environ.get("WEVOTE_DB_BUSY_TIMEOUT_MS", "5000")),
+        "cache_kib": int(os.environ.get("WEVOTE_DB_CACHE_KIB", "8192")),
+        "cached_statements": int(os.environ.get("WEVOTE_DB_STATEMENT_CACHE", "256")),
+    }
+
+
+class ConnectionPool:
+    """Fixed-size pool of tuned connections.
+
+    Connections are opened lazily up to ``size`` and then reused, so the
+    connect and PRAGMA cost is paid once per connection instead of once per
+    request. sqlite3's per-connection statement cache (``cached_statements``)
+    keeps prepared statements alive across requests.
+    """
+
+    def __init__(self, database, size=8, timeout=30.0, journal_mode="WAL", synchronous="NORMAL",
+                 busy_timeout_ms=5000, cache_kib=8192, cached_statements=256):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_kib = cache_kib
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "timeouts": 0}
+
+    def connect(self):
+        """Open a new tuned connection that is not tracked by the pool"""
+        db = sqlite3.connect(
+            self.database,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        db.row_factory = sqlite3.Row
+        db.execute(f"PRAGMA journal_mode = {self.journal_mode};")
+        db.execute(f"PRAGMA synchronous = {self.synchronous};")
+        db.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)};")
+        db.execute(f"PRAGMA cache_size = {-int(self.cache_kib)};")
+        db.execute("PRAGMA foreign_keys = ON;")
+        return db
+
+    def acquire(self):
+        started = time.perf_counter()
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            db = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    db = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    db = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection free after {self.timeout}s")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return db
+
+    def release(self, db):
+        """Return a connection, rolling back anything the request left open"""
+        try:
+            if db.in_transaction:
+                db.rollback()
+        except sqlite3.Error:
+            self._discard(db)
+            return
+        if self._closed:
+            # Checked out before close_all(); nobody will take it from _idle again.
+            self._discard(db)
+            return
+        self._idle.put(db)
+
+    def _discard(self, db):
+        db.close()
+        with self._lock:
+            self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open"] = self._created
+        stats["idle"] = self._idle.qsize()
+        stats["size"] = self.size
+        return stats
+
+    def close_all(self):
+        """Close idle connections now and the checked-out ones as they are released"""
+        self._closed = True
+        while True:
+            try:
+                db = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(db)
@@ -0,0 +1,173 @@
+"""
+Election Registry
+Several elections side by side, each with its own config, key, vote store and results
+
+Layout: ``<root>/<session_code>/election_config.json``, ``vote_log/``,
+``tally_checkpoint_<session_code>.json``, ``results.json`` and the binary
+``results.wvr`` archive.
+"""
+
+import json
+import os
+import shutil
+from datetime import datetime
+
+from results_archive import ArchiveError, ResultsArchive, write_archive
+from vote_log import DEFAULT_DIRECTORY, VoteLogReader, VoteLogWriter, create_log
+
+DEFAULT_ROOT = "elections"
+CONFIG_FILE = "election_config.json"
+RESULTS_FILE = "results.json"
+ARCHIVE_FILE = "results.wvr"
+
+
+class Election:
+    """One session's isolated store"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vote_log_dir = os.path.join(directory, DEFAULT_DIRECTORY)
+
+    @property
+    def config_path(self):
+        return os.path.join(self.directory, CONFIG_FILE)
+
+    def load_config(self):
+        with open(self.config_path) as f:
+            return json.load(f)
+
+    def save_config(self, config):
+        tmp = self.config_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp, self.config_path)
+
+    def set_status(self, status):
+        config = self.load_config()
+        config["status"] = status
+        self.save_config(config)
+
+    def vote_reader(self):
+        return VoteLogReader(self.vote_log_dir)
+
+    def vote_writer(self):
+        return VoteLogWriter(self.vote_log_dir)
+
+    def submit_vote(self, encrypted_data):
+        """Append a voter's encrypted ballot to this election's log and return its vote id"""
+        if self.load_config().get("status", "active") != "active":
+            raise ValueError(f"election in '{self.directory}' is not accepting votes")
+        writer = self.vote_writer()
+        try:
+            return writer.append(encrypted_data)
+        finally:
+            writer.close()
+
+    @property
+    def results_path(self):
+        return os.path.join(self.directory, RESULTS_FILE)
+
+    @property
+    def archive_path(self):
+        return os.path.join(self.directory, ARCHIVE_FILE)
+
+    def save_results(self, report, vote_flags=None):
+        """Archive the report, with per-vote flags, in the binary format and publish it as JSON.
+
+        The archive is written first: load_results reads it, while pages are
+        cached on the JSON file's mtime, so that mtime only moves once the
+        archive already holds the new report.
+        """
+        write_archive(self.archive_path, report, vote_flags)
+        tmp = self.results_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.results_path)
+
+    def open_archive(self):
+        return ResultsArchive(self.archive_path)
+
+    def load_results(self):
+        """Last saved report, from the archive when there is one"""
+        try:
+            with self.open_archive() as archive:
+                return archive.report()
+        except (FileNotFoundError, ArchiveError):
+            pass
+        try:
+            with open(self.results_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+class ElectionRegistry:
+    """Directory of elections keyed by session code"""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+
+    def path(self, session_code):
+        return os.path.join(self.root, session_code)
+
+    def create(self, session_code, candidates, key_string, status="active", method="plurality"):
+        directory = self.path(session_code)
+        os.makedirs(directory)
+        election = Election(directory)
+        create_log(election.vote_log_dir)
+        election.save_config({
+            "session_code": session_code,
+            "candidates": list(candidates),
+            "key": key_string,
+            "status": status,
+            "method": method,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        })
+        return election
+
+    def get(self, session_code):
+        election = Election(self.path(session_code))
+        if not os.path.exists(election.config_path):
+            raise KeyError(session_code)
+        return election
+
+    def results_path(self, session_code):
+        """Path of a registered election's published results; KeyError for unknown or unsafe codes"""
+        if os.path.basename(session_code) != session_code or session_code in ("", ".", ".."):
+            raise KeyError(session_code)
+        return self.get(session_code).results_path
+
+    def exists(self, session_code):
+        return os.path.exists(os.path.join(self.path(session_code), CONFIG_FILE))
+
+    def sessions(self):
+        """Session configs, newest first"""
+        if not os.path.isdir(self.root):
+            return []
+        configs = []
+        for name in os.listdir(self.root):
+            if self.exists(name):
+                configs.append(self.get(name).load_config())
+        return sorted(configs, key=lambda c: c.get("created", ""), reverse=True)
+
+    def import_config(self, config, legacy_directory="."):
+        """Register a legacy single-election config so it can sit next to newer sessions.
+
+        A vote log packed in ``legacy_directory`` before the registry existed
+        is moved into the election, together with its tally checkpoint.
+        """
+        session_code = config["session_code"]
+        if self.exists(session_code):
+            election = self.get(session_code)
+        else:
+            election = self.create(session_code, config["candidates"], config["key"],
+                                   config.get("status", "active"), config.get("method", "plurality"))
+        legacy_log = os.path.join(legacy_directory, DEFAULT_DIRECTORY)
+        if VoteLogReader(legacy_log).exists() and not election.vote_reader().exists():
+            shutil.rmtree(election.vote_log_dir, ignore_errors=True)  # empty log made by create()
+            shutil.move(legacy_log, election.vote_log_dir)
+            checkpoint = f"tally_checkpoint_{session_code}.json"
+            legacy_checkpoint = os.path.join(legacy_directory, checkpoint)
+            if os.path.exists(legacy_checkpoint) and not os.path.exists(os.path.join(election.directory, checkpoint)):
+                shutil.move(legacy_checkpoint, os.path.join(election.directory, checkpoint))
+        return election
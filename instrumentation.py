@@ -0,0 +1,172 @@
+"""
+Instrumentation
+Optional per-request SQL timing and route latency histograms, rendered in Prometheus text format
+"""
+
+import bisect
+import threading
+import time
+
+from flask import g, has_app_context, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                bucket_labels = _labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+def render_gauges(gauges):
+    """Render {name: (help, value)} as Prometheus gauges"""
+    lines = []
+    for name, (help_text, value) in gauges.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+
+class InstrumentedConnection:
+    """Connection proxy that times every statement and charges it to the current request"""
+
+    def __init__(self, db, metrics):
+        self._db = db
+        self._metrics = metrics
+
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            self._metrics.record_sql(sql, time.perf_counter() - started)
+
+    def execute(self, sql, *args):
+        return self._timed(self._db.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(self._db.executemany, sql, *args)
+
+    def commit(self):
+        return self._timed(lambda _: self._db.commit(), "COMMIT")
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+class Instrumentation:
+    """Route latency and SQL metrics; when disabled no hooks are installed and connections are not wrapped"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.route_latency = Histogram("wevote_request_duration_seconds", "Route latency.", ("route",))
+        self.request_sql_count = Histogram("wevote_request_sql_statements", "SQL statements per request.",
+                                           ("route",), COUNT_BUCKETS)
+        self.request_sql_time = Histogram("wevote_request_sql_duration_seconds", "SQL time per request.", ("route",))
+        self.sql_statements = Counter("wevote_sql_statements_total", "SQL statements by route and verb.",
+                                      ("route", "verb"))
+        self.sql_seconds = Counter("wevote_sql_seconds_total", "SQL execution time by route and verb.",
+                                   ("route", "verb"))
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    def instrument(self, db):
+        return InstrumentedConnection(db, self) if self.enabled else db
+
+    def _route(self):
+        rule = getattr(request, "url_rule", None)
+        return rule.rule if rule is not None else "unmatched"
+
+    def record_sql(self, sql, elapsed):
+        verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+        route = "background"
+        if has_app_context():
+            stats = g.setdefault("_sql_stats", [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            route = g.get("_route", "background")
+        self.sql_statements.inc(1, route, verb)
+        self.sql_seconds.inc(elapsed, route, verb)
+
+    def _start_request(self):
+        g._request_started = time.perf_counter()
+        g._route = self._route()
+
+    def _finish_request(self, exception):
+        started = g.pop("_request_started", None)
+        if started is None:
+            return
+        route = g.get("_route", "unmatched")
+        self.route_latency.observe(time.perf_counter() - started, route)
+        count, elapsed = g.pop("_sql_stats", (0, 0.0))
+        self.request_sql_count.observe(count, route)
+        self.request_sql_time.observe(elapsed, route)
+
+    def render(self, gauges):
+        lines = render_gauges(gauges)
+        if self.enabled:
+            for metric in (self.route_latency, self.request_sql_count, self.request_sql_time,
+                           self.sql_statements, self.sql_seconds):
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
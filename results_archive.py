@@ -0,0 +1,304 @@
+"""
+Results Archive
+Compact, versioned and checksummed binary archive of a counted election, read through mmap
+
+Layout (little-endian): a header ``[magic "WVRA"][u16 version][u16 sections]
+[u64 body length][u32 crc32 of body]`` followed by sections of
+``[4-byte tag][u64 length][payload]``:
+
+* ``META`` JSON with the session code, method, totals and winner
+* ``CAND`` candidates in ranking order with votes and percentage
+* ``RNDS`` per-round counts, exhausted ballots, eliminations and transfers
+* ``FLAG`` sorted vote ids with one validity byte each (0 valid, else 1 + index in REASONS)
+
+Usage: python results_archive.py ARCHIVE [--format text|json|csv] [--votes] [--output FILE]
+"""
+
+import argparse
+import bisect
+import csv
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from tally_report import FORMATS, render
+from vote_validation import REASONS
+
+MAGIC = b"WVRA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQI")
+SECTION = struct.Struct("<4sQ")
+COUNT = struct.Struct("<I")
+CANDIDATE = struct.Struct("<qdH")
+ROUND = struct.Struct("<qi")
+META_FIELDS = ("session_code", "timestamp", "method", "total_votes", "invalid_votes", "invalid_reasons", "winner")
+
+
+class ArchiveError(ValueError):
+    """The file is not a readable results archive"""
+
+
+def _pack_ints(fmt, values):
+    return struct.pack(f"<{len(values)}{fmt}", *values)
+
+
+def _meta_section(report):
+    return json.dumps({field: report.get(field) for field in META_FIELDS}, ensure_ascii=False).encode()
+
+
+def _candidate_section(ranking):
+    parts = [COUNT.pack(len(ranking))]
+    for entry in ranking:
+        name = entry["candidate"].encode()
+        parts.append(CANDIDATE.pack(entry["votes"], entry["percentage"], len(name)) + name)
+    return b"".join(parts)
+
+
+def _rounds_section(rounds, candidates):
+    index = {candidate: i for i, candidate in enumerate(candidates)}
+    k = len(candidates)
+    counts, transfers, summary = [], [], []
+    for entry in rounds:
+        row = [-1] * k
+        for candidate, votes in entry["counts"].items():
+            row[index[candidate]] = votes
+        counts += row
+        moved = [0] * (k + 1)
+        for name, votes in entry.get("transfers", {}).items():
+            moved[k if name == "exhausted" else index[name]] = votes
+        transfers += moved
+        eliminated = entry.get("eliminated")
+        summary.append(ROUND.pack(entry.get("exhausted", 0), index[eliminated] if eliminated else -1))
+    return (struct.pack("<II", len(rounds), k) + _pack_ints("q", counts) + b"".join(summary)
+            + _pack_ints("q", transfers))
+
+
+def _flag_section(vote_flags):
+    items = sorted(vote_flags.items())
+    ids = [vote_id.encode() for vote_id, _ in items]
+    offsets = [0]
+    for encoded in ids:
+        offsets.append(offsets[-1] + len(encoded))
+    flags = bytes(0 if reason is None else REASONS.index(reason) + 1 for _, reason in items)
+    return COUNT.pack(len(items)) + _pack_ints("I", offsets) + b"".join(ids) + flags
+
+
+def write_archive(path, report, vote_flags=None):
+    """Write ``report`` (from tally_report.build_report) and optional {vote_id: reason or None} atomically"""
+    candidates = [entry["candidate"] for entry in report["ranking"]]
+    sections = [
+        (b"META", _meta_section(report)),
+        (b"CAND", _candidate_section(report["ranking"])),
+        (b"RNDS", _rounds_section(report.get("rounds") or [], candidates)),
+        (b"FLAG", _flag_section(vote_flags or {})),
+    ]
+    body = b"".join(SECTION.pack(tag, len(payload)) + payload for tag, payload in sections)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections), len(body), zlib.crc32(body)))
+        f.write(body)
+    os.replace(tmp, path)
+
+
+class ResultsArchive:
+    """Read-only view of an archive; per-vote flags are looked up in place without loading them"""
+
+    def __init__(self, path, verify=True):
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise ArchiveError(f"{path}: empty file") from None
+        try:
+            self._sections = self._read_sections(path, verify)
+            self._load_flag_index()
+        except Exception:
+            self._mm.close()
+            raise
+
+    def _read_sections(self, path, verify):
+        if len(self._mm) < HEADER.size:
+            raise ArchiveError(f"{path}: truncated header")
+        magic, version, count, length, crc = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ArchiveError(f"{path}: not a results archive")
+        if version > VERSION:
+            raise ArchiveError(f"{path}: archive version {version} is newer than supported ({VERSION})")
+        if len(self._mm) != HEADER.size + length:
+            raise ArchiveError(f"{path}: truncated archive")
+        if verify:
+            with memoryview(self._mm) as view:
+                if zlib.crc32(view[HEADER.size:]) != crc:
+                    raise ArchiveError(f"{path}: checksum mismatch")
+        sections = {}
+        offset = HEADER.size
+        for _ in range(count):
+            tag, size = SECTION.unpack_from(self._mm, offset)
+            offset += SECTION.size
+            sections[tag] = (offset, size)
+            offset += size
+        return sections
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _section(self, tag):
+        try:
+            return self._sections[tag]
+        except KeyError:
+            raise ArchiveError(f"missing {tag.decode()} section") from None
+
+    def meta(self):
+        offset, size = self._section(b"META")
+        return json.loads(self._mm[offset:offset + size].decode())
+
+    def ranking(self):
+        offset, _ = self._section(b"CAND")
+        (n,) = COUNT.unpack_from(self._mm, offset)
+        offset += COUNT.size
+        ranking = []
+        for rank in range(1, n + 1):
+            votes, percentage, name_length = CANDIDATE.unpack_from(self._mm, offset)
+            offset += CANDIDATE.size
+            name = self._mm[offset:offset + name_length].decode()
+            offset += name_length
+            ranking.append({"rank": rank, "candidate": name, "votes": votes, "percentage": percentage})
+        return ranking
+
+    def rounds(self, candidates):
+        offset, _ = self._section(b"RNDS")
+        n, k = struct.unpack_from("<II", self._mm, offset)
+        offset += 8
+        counts = struct.unpack_from(f"<{n * k}q", self._mm, offset)
+        offset += 8 * n * k
+        summary = [ROUND.unpack_from(self._mm, offset + i * ROUND.size) for i in range(n)]
+        offset += ROUND.size * n
+        transfers = struct.unpack_from(f"<{n * (k + 1)}q", self._mm, offset)
+        rounds = []
+        for r in range(n):
+            row = counts[r * k:(r + 1) * k]
+            moved = transfers[r * (k + 1):(r + 1) * (k + 1)]
+            exhausted, eliminated = summary[r]
+            rounds.append({
+                "round": r + 1,
+                "counts": {candidates[i]: row[i] for i in range(k) if row[i] >= 0},
+                "exhausted": exhausted,
+                "eliminated": candidates[eliminated] if eliminated >= 0 else None,
+                "transfers": {("exhausted" if i == k else candidates[i]): moved[i]
+                              for i in range(k + 1) if moved[i]},
+            })
+        return rounds
+
+    def report(self):
+        """The archived report in the shape tally_report.build_report produces"""
+        report = self.meta()
+        report["ranking"] = self.ranking()
+        rounds = self.rounds([entry["candidate"] for entry in report["ranking"]])
+        if rounds:
+            report["rounds"] = rounds
+        return report
+
+    def _load_flag_index(self):
+        offset, _ = self._section(b"FLAG")
+        (self.vote_count,) = COUNT.unpack_from(self._mm, offset)
+        self._offsets_at = offset + COUNT.size
+        self._ids_at = self._offsets_at + 4 * (self.vote_count + 1)
+        (ids_length,) = COUNT.unpack_from(self._mm, self._offsets_at + 4 * self.vote_count)
+        self._flags_at = self._ids_at + ids_length
+
+    def _vote_id(self, i):
+        start, end = struct.unpack_from("<II", self._mm, self._offsets_at + 4 * i)
+        return self._mm[self._ids_at + start:self._ids_at + end].decode()
+
+    def _reason(self, i):
+        flag = self._mm[self._flags_at + i]
+        return REASONS[flag - 1] if flag else None
+
+    def __len__(self):
+        return self.vote_count
+
+    def flag(self, vote_id):
+        """Rejection reason for vote_id, None if it was counted; KeyError if it was never processed"""
+        ids = _LazyIds(self)
+        i = bisect.bisect_left(ids, vote_id)
+        if i == self.vote_count or ids[i] != vote_id:
+            raise KeyError(vote_id)
+        return self._reason(i)
+
+    def flags(self):
+        """Iterate (vote_id, reason or None) in vote id order"""
+        for i in range(self.vote_count):
+            yield self._vote_id(i), self._reason(i)
+
+    def flag_counts(self):
+        flags = self._mm[self._flags_at:self._flags_at + self.vote_count]
+        counts = {"valid": flags.count(0)}
+        for i, reason in enumerate(REASONS, 1):
+            counts[reason] = flags.count(i)
+        return counts
+
+
+class _LazyIds:
+    """Sequence adapter so bisect can search vote ids straight from the mapped file"""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __len__(self):
+        return self.archive.vote_count
+
+    def __getitem__(self, i):
+        return self.archive._vote_id(i)
+
+
+def votes_csv(archive):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["vote_id", "valid", "reason"])
+    for vote_id, reason in archive.flags():
+        writer.writerow([vote_id, int(reason is None), reason or ""])
+    return out.getvalue()
+
+
+def votes_json(archive):
+    return json.dumps([{"vote_id": vote_id, "valid": reason is None, "reason": reason}
+                       for vote_id, reason in archive.flags()], indent=2) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a binary results archive to text, JSON or CSV")
+    parser.add_argument("archive", help="results archive (.wvr)")
+    parser.add_argument("--format", choices=FORMATS, default="text", help="output format")
+    parser.add_argument("--votes", action="store_true", help="per-vote validity flags instead of the tally")
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        with ResultsArchive(args.archive) as archive:
+            if args.votes:
+                if args.format == "text":
+                    parser.error("--votes needs --format csv or json")
+                output = votes_csv(archive) if args.format == "csv" else votes_json(archive)
+            else:
+                output = render(archive.report(), args.format)
+    except (OSError, ArchiveError) as e:
+        parser.exit(1, f"{e}\n")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output)
+
+
+if __name__ == "__main__":
+    main()
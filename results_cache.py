@@ -0,0 +1,95 @@
+"""
+Results Cache
+In-memory results snapshot reused until the tally version changes or the TTL expires,
+plus a small cache of rendered pages keyed by content digest
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def snapshot_digest(data):
+    """Content digest of a results snapshot, stable across processes"""
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode(), digest_size=12).hexdigest()
+
+
+class ResultsCache:
+    """Caches one results snapshot keyed by the tally version.
+
+    The TTL bounds staleness when another process commits votes, since the
+    version counter only sees commits made in this process.
+    """
+
+    def __init__(self, version, ttl):
+        self.version = version
+        self.ttl = ttl
+        self.hits = 0
+        self.builds = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry, version):
+        return entry is not None and entry[0] == version and time.monotonic() - entry[1] < self.ttl
+
+    def _current(self, build):
+        version = self.version.value
+        entry = self._entry
+        if self._fresh(entry, version):
+            self.hits += 1
+            return entry
+        with self._lock:
+            entry = self._entry
+            if self._fresh(entry, version):
+                self.hits += 1
+                return entry
+            data = build()
+            entry = self._entry = (version, time.monotonic(), data, snapshot_digest(data))
+            self.builds += 1
+            return entry
+
+    def get(self, build):
+        """Return the cached snapshot, calling build() only when it is stale"""
+        return self._current(build)[2]
+
+    def snapshot(self, build):
+        """(data, digest) of one cached snapshot, so an ETag always matches the data rendered with it"""
+        _, _, data, digest = self._current(build)
+        return data, digest
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+
+class PageCache:
+    """Rendered HTML keyed by whatever the page depends on, least recently used evicted first"""
+
+    def __init__(self, size=32):
+        self.size = size
+        self.hits = 0
+        self.renders = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return page
+        page = render()
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+            self.renders += 1
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
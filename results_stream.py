@@ -0,0 +1,137 @@
+"""
+Results Stream
+Single publisher that turns tally changes into Server-Sent Events for many subscribers
+"""
+
+import json
+import queue
+import threading
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def snapshot_deltas(previous, current):
+    """List the nominees whose votes changed, or None when the ballot itself changed"""
+    before = {n["id"]: n for cat in previous for n in cat["nominees"]}
+    after = {n["id"]: (cat, n) for cat in current for n in cat["nominees"]}
+    if before.keys() != after.keys():
+        return None
+    changes = []
+    for nominee_id, (cat, n) in after.items():
+        if before[nominee_id]["votes"] != n["votes"]:
+            changes.append({
+                "category_id": cat["category_id"],
+                "category_total": cat["total"],
+                "nominee_id": nominee_id,
+                "votes": n["votes"],
+                "pct": n["pct"],
+            })
+    if changes:
+        # Percentages shift for every nominee in a category that received a vote.
+        touched = {c["category_id"] for c in changes}
+        changed_ids = {c["nominee_id"] for c in changes}
+        for nominee_id, (cat, n) in after.items():
+            if cat["category_id"] in touched and nominee_id not in changed_ids:
+                changes.append({
+                    "category_id": cat["category_id"],
+                    "category_total": cat["total"],
+                    "nominee_id": nominee_id,
+                    "votes": n["votes"],
+                    "pct": n["pct"],
+                })
+    return changes
+
+
+class Subscriber:
+    def __init__(self, maxsize):
+        self.events = queue.Queue(maxsize)
+        self.closed = False
+
+
+class ResultsPublisher:
+    """Aggregates once per tally change and fans the delta out to every subscriber.
+
+    Slow subscribers whose queue fills up are dropped rather than allowed to
+    hold back the others. The keepalive interval also bounds how long a
+    change committed by another process takes to show up.
+    """
+
+    def __init__(self, version, load_results, keepalive=15.0, queue_size=64):
+        self.version = version
+        self.load_results = load_results
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.aggregations = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._snapshot = None
+
+    def subscribe(self):
+        """Register a subscriber and return it with the full snapshot it should start from"""
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._aggregate()
+            snapshot = self._snapshot
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="results-publisher", daemon=True)
+                self._thread.start()
+        return subscriber, snapshot
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def _aggregate(self):
+        self.aggregations += 1
+        return self.load_results()
+
+    def _broadcast(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.events.put_nowait(message)
+            except queue.Full:
+                self.unsubscribe(subscriber)
+
+    def _run(self):
+        seen = self.version.value
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._snapshot = None
+                    return
+            seen = self.version.wait_for_change(seen, self.keepalive)
+            current = self._aggregate()
+            with self._lock:
+                previous, self._snapshot = self._snapshot, current
+            changes = snapshot_deltas(previous, current)
+            if changes is None:
+                self._broadcast(format_event("snapshot", {"version": seen, "results": current}))
+            elif changes:
+                self._broadcast(format_event("delta", {"version": seen, "changes": changes}))
+            else:
+                self._broadcast(": keepalive\n\n")
+
+    def stream(self):
+        """Generator of SSE messages for one client"""
+        subscriber, snapshot = self.subscribe()
+        try:
+            yield format_event("snapshot", {"version": self.version.value, "results": snapshot})
+            while not subscriber.closed:
+                try:
+                    yield subscriber.events.get(timeout=self.keepalive * 2)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
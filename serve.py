@@ -0,0 +1,86 @@
+"""
+Serve
+Production launcher for the voting app with a configurable number of workers
+
+Picks the first available server (uvicorn over ASGI, then gunicorn, waitress,
+and finally Werkzeug's threaded server). Votes go through the group-commit
+writer, and with more than one worker the ballot sessions move to the shared
+SQLite store so a voter can land on any worker.
+
+Concurrency: every server runs up to --workers x --threads requests at once,
+each on its own thread (uvicorn through asgi.py's thread pool, gunicorn's
+gthread workers, waitress' channel threads; Werkzeug starts a thread per
+request). An open /results/stream subscriber holds one of those threads for
+as long as it stays connected, so size --threads above the expected number
+of concurrent results viewers per worker.
+
+Usage: python serve.py [--workers 4] [--threads 32] [--host 0.0.0.0] [--port 8000] [--server auto]
+"""
+
+import argparse
+import importlib.util
+import os
+
+SERVERS = ("uvicorn", "gunicorn", "waitress", "werkzeug")
+
+
+def available(server):
+    return server == "werkzeug" or importlib.util.find_spec(server) is not None
+
+
+def configure(workers):
+    """Environment defaults applied before the app module is imported"""
+    os.environ.setdefault("WEVOTE_DURABILITY", "group")
+    if workers > 1:
+        os.environ.setdefault("WEVOTE_SESSION_BACKEND", "sqlite")
+        if os.environ["WEVOTE_SESSION_BACKEND"] == "memory":
+            raise SystemExit("WEVOTE_SESSION_BACKEND=memory cannot be shared between workers; use sqlite or cookie")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the WeVote web app")
+    parser.add_argument("--host", default=os.environ.get("WEVOTE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WEVOTE_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEVOTE_WORKERS", "1")),
+                        help="worker processes")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEVOTE_THREADS", "32")),
+                        help="request threads per worker (uvicorn, gunicorn, waitress)")
+    parser.add_argument("--server", choices=("auto",) + SERVERS, default=os.environ.get("WEVOTE_SERVER", "auto"))
+    args = parser.parse_args()
+
+    server = args.server
+    if server == "auto":
+        server = next(s for s in SERVERS if available(s))
+    elif not available(server):
+        parser.error(f"{server} is not installed")
+    if server in ("waitress", "werkzeug") and args.workers > 1:
+        parser.error(f"{server} runs a single process; install uvicorn or gunicorn for --workers > 1")
+
+    configure(args.workers)
+    import app as wevote
+
+    # Create the schema and sample ballot once, before any worker starts.
+    with wevote.app.app_context():
+        wevote.startup()
+    wevote.close_pool()
+
+    print(f"Serving WeVote with {server} on http://{args.host}:{args.port} "
+          f"({args.workers} workers, durability={wevote.DURABILITY}, sessions={wevote.SESSION_BACKEND})")
+    if server == "uvicorn":
+        import uvicorn
+
+        os.environ["WEVOTE_THREADS"] = str(args.threads)  # read by asgi.py in each worker
+        uvicorn.run("asgi:asgi_app", host=args.host, port=args.port, workers=args.workers)
+    elif server == "gunicorn":
+        os.execvp("gunicorn", ["gunicorn", "--workers", str(args.workers), "--threads", str(args.threads),
+                               "--bind", f"{args.host}:{args.port}", "app:app"])
+    elif server == "waitress":
+        import waitress
+
+        waitress.serve(wevote.app, host=args.host, port=args.port, threads=args.threads)
+    else:
+        wevote.app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
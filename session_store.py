@@ -0,0 +1,164 @@
+"""
+Session Store
+Server-side ballot sessions; the cookie only carries an opaque session id
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemoryStore:
+    """Process-local store; expired sessions are swept at most once per sweep_interval"""
+
+    def __init__(self, sweep_interval=60):
+        self.sweep_interval = sweep_interval
+        self._data = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def save(self, sid, payload, expires):
+        with self._lock:
+            self._data[sid] = (payload, expires)
+            if time.monotonic() >= self._next_sweep:
+                self._sweep()
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def _sweep(self):
+        now = time.time()
+        for sid in [sid for sid, (_, expires) in self._data.items() if expires < now]:
+            del self._data[sid]
+        self._next_sweep = time.monotonic() + self.sweep_interval
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteStore:
+    """SQLite-backed store that can be shared by several worker processes"""
+
+    def __init__(self, path, sweep_interval=60):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._next_sweep = time.monotonic() + sweep_interval
+        db = self._db()
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);")
+        db.commit()
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode = WAL;")
+            db.execute("PRAGMA synchronous = NORMAL;")
+        return db
+
+    def load(self, sid):
+        row = self._db().execute("SELECT data FROM sessions WHERE id = ? AND expires >= ?", (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, payload, expires):
+        db = self._db()
+        db.execute(
+            "INSERT INTO sessions (id, data, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+            (sid, payload, expires),
+        )
+        if time.monotonic() >= self._next_sweep:
+            self._next_sweep = time.monotonic() + self.sweep_interval
+            db.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+        db.commit()
+
+    def delete(self, sid):
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+        db.commit()
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in a store and only writes it back when it changed"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            payload = self.store.load(sid)
+            if payload is not None:
+                return ServerSession(self.serializer.loads(payload), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(24), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), time.time() + self.ttl)
+        if session.new:
+            response.set_cookie(
+                name,
+                session.sid,
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add("Cookie")
+
+
+def build_session_interface(backend, ttl, path):
+    """Return the session interface for WEVOTE_SESSION_BACKEND, or None to keep signed cookies"""
+    if backend == "cookie":
+        return None
+    if backend == "sqlite":
+        return ServerSessionInterface(SqliteStore(path), ttl)
+    if backend == "memory":
+        return ServerSessionInterface(MemoryStore(), ttl)
+    raise ValueError(f"unknown session backend: {backend}")
@@ -0,0 +1,200 @@
+"""
+Tabulation
+Plurality, approval and instant-runoff (ranked-choice) tabulation over ballots kept as compact integer arrays
+
+A ballot is a tuple of candidate indices, in preference order for ranked
+ballots. For counting they are packed into one ``(ballots, width)`` integer
+matrix padded with a sentinel, and every round is a NumPy ``bincount`` over
+the ballots' current choices; only ballots whose choice was just eliminated
+are moved. NumPy is imported lazily and is optional: without it the same
+rounds are computed with per-candidate piles in pure Python.
+"""
+
+from itertools import chain
+
+PLURALITY = "plurality"
+APPROVAL = "approval"
+IRV = "irv"
+METHODS = (PLURALITY, APPROVAL, IRV)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def pack(np, ballots, candidates):
+    """Pack ballots into an int matrix with one extra column; index len(candidates) marks padding"""
+    k = len(candidates)
+    dtype = np.int16 if k < 2 ** 15 - 1 else np.int32
+    lengths = np.fromiter((len(b) for b in ballots), dtype=np.intp, count=len(ballots))
+    width = int(lengths.max()) if len(ballots) else 0
+    matrix = np.full((len(ballots), width + 1), k, dtype=dtype)
+    total = int(lengths.sum())
+    if total:
+        rows = np.repeat(np.arange(len(ballots)), lengths)
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        matrix[rows, np.arange(total) - starts] = np.fromiter(chain.from_iterable(ballots), dtype=dtype, count=total)
+    return matrix
+
+
+def _round(number, counts, active, candidates, exhausted, eliminated=None, transfers=None):
+    return {
+        "round": number,
+        "counts": {candidates[i]: int(counts[i]) for i in range(len(candidates)) if active[i]},
+        "exhausted": int(exhausted),
+        "eliminated": candidates[eliminated] if eliminated is not None else None,
+        "transfers": transfers or {},
+    }
+
+
+def _single_round(method, counts, candidates, ballots):
+    counts = [int(c) for c in counts]
+    order = sorted(range(len(candidates)), key=lambda i: (-counts[i], i))
+    winner = order[0] if ballots and counts[order[0]] > 0 else None
+    return {
+        "method": method,
+        "ballots": ballots,
+        "rounds": [_round(1, counts, [True] * len(candidates), candidates, 0)],
+        "vote_counts": dict(zip(candidates, counts)),
+        "order": [candidates[i] for i in order],
+        "winner": candidates[winner] if winner is not None else None,
+    }
+
+
+def _count_first_or_all(method, ballots, candidates):
+    np = _numpy()
+    k = len(candidates)
+    if np is not None and ballots:
+        matrix = pack(np, ballots, candidates)
+        picks = matrix[:, 0] if method == PLURALITY else matrix.ravel()
+        return np.bincount(picks, minlength=k + 1)[:k]
+    counts = [0] * k
+    for ballot in ballots:
+        for index in (ballot[:1] if method == PLURALITY else ballot):
+            counts[index] += 1
+    return counts
+
+
+def _elimination_order(counts, active, first_round):
+    """Lowest continuing candidate; ties go to fewer first-round votes, then to the later-listed candidate"""
+    return min((i for i in range(len(active)) if active[i]), key=lambda i: (counts[i], first_round[i], -i))
+
+
+def _irv_numpy(np, ballots, candidates):
+    k = len(candidates)
+    matrix = pack(np, ballots, candidates)
+    rows_all = np.arange(len(ballots))
+    active = np.ones(k + 1, dtype=bool)
+    active[k] = False
+    position = np.zeros(len(ballots), dtype=np.intp)
+    current = matrix[:, 0].astype(np.intp)
+
+    def advance(rows):
+        # Move each ballot past eliminated candidates; the sentinel column
+        # stops it once its rankings are used up (exhausted).
+        while rows.size:
+            position[rows] += 1
+            choice = matrix[rows, position[rows]]
+            current[rows] = choice
+            rows = rows[~active[choice] & (choice != k)]
+
+    counts = np.bincount(current, minlength=k + 1)
+    first_round = counts[:k].copy()
+    rounds = []
+    eliminated_order = []
+    while True:
+        continuing = int(counts[:k][active[:k]].sum())
+        leader = int(np.argmax(np.where(active[:k], counts[:k], -1)))
+        if counts[leader] * 2 > continuing or int(active[:k].sum()) <= 1:
+            rounds.append(_round(len(rounds) + 1, counts, active, candidates, counts[k]))
+            break
+        loser = _elimination_order(counts, active[:k], first_round)
+        snapshot = active.copy()
+        active[loser] = False
+        moved = rows_all[current == loser]
+        advance(moved)
+        gained = np.bincount(current[moved], minlength=k + 1)
+        transfers = {("exhausted" if i == k else candidates[i]): int(gained[i]) for i in np.flatnonzero(gained)}
+        rounds.append(_round(len(rounds) + 1, counts, snapshot, candidates, counts[k], loser, transfers))
+        eliminated_order.append(loser)
+        counts = counts + gained
+        counts[loser] = 0
+    return rounds, [int(c) for c in counts[:k]], eliminated_order, leader
+
+
+def _irv_python(ballots, candidates):
+    k = len(candidates)
+    active = [True] * k
+    position = [0] * len(ballots)
+    piles = [[] for _ in range(k + 1)]
+    for row, ballot in enumerate(ballots):
+        piles[ballot[0] if ballot else k].append(row)
+    counts = [len(pile) for pile in piles]
+    first_round = counts[:k]
+    rounds = []
+    eliminated_order = []
+    while True:
+        continuing = sum(counts[i] for i in range(k) if active[i])
+        leader = max((i for i in range(k) if active[i]), key=lambda i: (counts[i], -i))
+        if counts[leader] * 2 > continuing or sum(active) <= 1:
+            rounds.append(_round(len(rounds) + 1, counts, active, candidates, counts[k]))
+            break
+        loser = _elimination_order(counts, active, first_round)
+        snapshot = active[:]
+        active[loser] = False
+        transfers = {}
+        for row in piles[loser]:
+            ballot = ballots[row]
+            pos = position[row] + 1
+            while pos < len(ballot) and not active[ballot[pos]]:
+                pos += 1
+            position[row] = pos
+            choice = ballot[pos] if pos < len(ballot) else k
+            piles[choice].append(row)
+            name = "exhausted" if choice == k else candidates[choice]
+            transfers[name] = transfers.get(name, 0) + 1
+        rounds.append(_round(len(rounds) + 1, counts, snapshot, candidates, counts[k], loser, transfers))
+        eliminated_order.append(loser)
+        piles[loser] = []
+        counts = [len(pile) for pile in piles]
+    return rounds, counts[:k], eliminated_order, leader
+
+
+def tabulate(method, ballots, candidates):
+    """Count ``ballots`` (tuples of candidate indices) and return the rounds, final counts and finishing order.
+
+    For IRV each round lists the continuing candidates' votes, the ballots
+    exhausted so far, who was eliminated and where their ballots went. The
+    reported count of an eliminated candidate is their last-round total.
+    """
+    candidates = list(candidates)
+    if method in (PLURALITY, APPROVAL):
+        return _single_round(method, _count_first_or_all(method, ballots, candidates), candidates, len(ballots))
+    if method != IRV:
+        raise ValueError(f"unknown tabulation method: {method}")
+    if not ballots:
+        return _single_round(IRV, [0] * len(candidates), candidates, 0)
+
+    np = _numpy()
+    if np is not None:
+        rounds, counts, eliminated, winner = _irv_numpy(np, ballots, candidates)
+    else:
+        rounds, counts, eliminated, winner = _irv_python(ballots, candidates)
+    last_count = dict(zip(candidates, counts))
+    for entry in rounds:
+        if entry["eliminated"] is not None:
+            last_count[entry["eliminated"]] = entry["counts"][entry["eliminated"]]
+    finalists = sorted((i for i in range(len(candidates)) if i not in eliminated), key=lambda i: (-counts[i], i))
+    order = finalists + eliminated[::-1]
+    return {
+        "method": IRV,
+        "ballots": len(ballots),
+        "rounds": rounds,
+        "vote_counts": last_count,
+        "order": [candidates[i] for i in order],
+        "winner": candidates[winner] if counts[winner] > 0 else None,
+    }
@@ -0,0 +1,323 @@
+"""
+Tally Engine
+Headless counting pipeline (load, decrypt, validate, count) shared by the admin GUI and the CLI
+
+Ranking and output formats live in tally_report.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+
+from crypto_handler import CryptoHandler
+from election_registry import Election, ElectionRegistry
+from tally_ledger import TallyLedger
+from tabulation import PLURALITY, tabulate
+from tally_report import FORMATS, build_report, render, write_report
+from vote_log import DEFAULT_DIRECTORY, VoteLogReader
+from vote_validation import (DECRYPT_FAILED, DUPLICATE_BALLOT, DUPLICATE_PAYLOAD, REASONS, DedupIndex, classify,
+                             classify_ballot, payload_digest)
+
+_worker = {}
+
+LOG_SOURCE = "vote_log"
+FILE_SOURCE = "vote_files"
+
+
+def _make_decryptor(key_string):
+    crypto = CryptoHandler()
+    return crypto, crypto.string_to_key(key_string)
+
+
+def _init_worker(key_string):
+    """Build the crypto handler and key once per worker process (pool workers only)"""
+    _worker["crypto"], _worker["key"] = _make_decryptor(key_string)
+
+
+def _new_tally(candidates):
+    return {
+        "vote_counts": {candidate: 0 for candidate in candidates},
+        "total_votes": 0,
+        "invalid_votes": 0,
+        "invalid_reasons": {reason: 0 for reason in REASONS},
+        "rankings": [],
+        "rejected": [],
+        "errors": [],
+        "processed": 0,
+    }
+
+
+def _reject(tally, reason, vote_id):
+    tally["invalid_votes"] += 1
+    tally["invalid_reasons"][reason] += 1
+    tally["rejected"].append((vote_id, reason))
+
+
+def _accept(tally, choice):
+    """Count a valid vote: a candidate name, or a tuple of candidate indices for ranked/approval ballots"""
+    if isinstance(choice, tuple):
+        tally["rankings"].append(choice)
+    else:
+        tally["vote_counts"][choice] += 1
+    tally["total_votes"] += 1
+
+
+def _count_chunk(session_code, candidates, chunk, method=PLURALITY, decryptor=None):
+    """Decrypt and classify one chunk of (vote_id, encrypted_data) pairs.
+
+    Votes carrying a ``ballot_id`` are returned rather than counted, because
+    only the parent sees every chunk and can tell whether the id is a replay.
+    Ranked and approval ballots come back as tuples of candidate indices in
+    ``rankings`` for tabulation. ``decryptor`` is a (crypto, key) pair for
+    in-process counting; pool workers use the one built by _init_worker.
+    """
+    crypto, key = decryptor or (_worker["crypto"], _worker["key"])
+    tally = _new_tally(candidates)
+    tally["ballots"] = []
+    candidate_index = {candidate: i for i, candidate in enumerate(candidates)}
+    for vote_id, encrypted_data in chunk:
+        try:
+            vote_data = crypto.decrypt_vote(encrypted_data, key)
+        except Exception as e:
+            _reject(tally, DECRYPT_FAILED, vote_id)
+            tally["errors"].append((vote_id, str(e)))
+            continue
+        if method == PLURALITY:
+            choice, reason = classify(vote_data, session_code, tally["vote_counts"])
+        else:
+            choice, reason = classify_ballot(vote_data, session_code, candidate_index)
+        if reason:
+            _reject(tally, reason, vote_id)
+        elif vote_data.get("ballot_id") is not None:
+            tally["ballots"].append((vote_id, str(vote_data["ballot_id"]), choice))
+        else:
+            _accept(tally, choice)
+    tally["processed"] = len(chunk)
+    return tally
+
+
+def _merge(tally, partial, index):
+    for candidate, votes in partial["vote_counts"].items():
+        tally["vote_counts"][candidate] += votes
+    tally["total_votes"] += partial["total_votes"]
+    tally["invalid_votes"] += partial["invalid_votes"]
+    for reason, count in partial["invalid_reasons"].items():
+        tally["invalid_reasons"][reason] += count
+    tally["rankings"].extend(partial["rankings"])
+    tally["rejected"].extend(partial["rejected"])
+    for vote_id, ballot_id, choice in partial["ballots"]:
+        if index.first_ballot(ballot_id):
+            _accept(tally, choice)
+        else:
+            _reject(tally, DUPLICATE_BALLOT, vote_id)
+    tally["errors"].extend(partial["errors"])
+    tally["processed"] += partial["processed"]
+
+
+def vote_source(config_manager, log_directory=DEFAULT_DIRECTORY, session_code=None):
+    """Which store load_votes reads: LOG_SOURCE once the log has records, else FILE_SOURCE.
+
+    The per-file store is shared and belongs to the election named in
+    ConfigManager's config, so any other ``session_code`` reads its own
+    (possibly empty) log and never another election's votes.
+    """
+    if VoteLogReader(log_directory).exists():
+        return LOG_SOURCE
+    if session_code is not None:
+        legacy = config_manager.load_election_config()
+        if not legacy or legacy.get("session_code") != session_code:
+            return LOG_SOURCE
+    return FILE_SOURCE
+
+
+def load_votes(config_manager, log_directory=DEFAULT_DIRECTORY, session_code=None):
+    """Iterate (vote_id, encrypted_data) from the vote log, or from per-file votes if there is no log yet"""
+    if vote_source(config_manager, log_directory, session_code) == LOG_SOURCE:
+        return VoteLogReader(log_directory).scan()
+    return config_manager.load_all_votes()
+
+
+def _unique_payloads(votes, tally, index):
+    """Drop exact re-submissions before they reach a worker"""
+    for vote_id, encrypted_data in votes:
+        if index.first_payload(payload_digest(encrypted_data)):
+            yield vote_id, encrypted_data
+        else:
+            _reject(tally, DUPLICATE_PAYLOAD, vote_id)
+            tally["processed"] += 1
+
+
+def _chunks(votes, chunk_size):
+    votes = iter(votes)
+    while True:
+        chunk = list(islice(votes, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def count_votes(votes, key_string, session_code, candidates, workers=None, chunk_size=500, progress=None, index=None,
+                method=PLURALITY):
+    """Decrypt, validate and count ``votes``, an iterable of (vote_id, encrypted_data) pairs.
+
+    Votes are read lazily in chunks and at most two chunks per worker are in
+    flight, so memory stays bounded however large the election is. Duplicate
+    payloads are caught by digest as chunks are cut and duplicate ballot ids
+    as partial tallies are merged, both against ``index`` (a DedupIndex), so
+    validation adds no second pass. ``progress(processed)`` is called in the
+    caller's thread after each merge. ``workers=1`` counts in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    index = index if index is not None else DedupIndex()
+    tally = _new_tally(candidates)
+    chunks = _chunks(_unique_payloads(votes, tally, index), chunk_size)
+
+    if workers == 1:
+        # Several elections may count in-process on separate threads
+        # (count_sessions), so the key stays local instead of in _worker.
+        decryptor = _make_decryptor(key_string)
+        for chunk in chunks:
+            _merge(tally, _count_chunk(session_code, candidates, chunk, method, decryptor), index)
+            if progress:
+                progress(tally["processed"])
+        return tally
+
+    # Partial tallies are merged in submission order, never in finishing
+    # order: the first copy of a replayed ballot id is the one counted, so
+    # the result must not depend on which chunk a worker finished first.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(key_string,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_count_chunk, session_code, candidates, chunk, method))
+            if len(pending) >= workers * 2:
+                _merge(tally, pending.popleft().result(), index)
+                if progress:
+                    progress(tally["processed"])
+        while pending:
+            _merge(tally, pending.popleft().result(), index)
+            if progress:
+                progress(tally["processed"])
+    return tally
+
+
+def count_incremental(votes, key_string, session_code, candidates, full=False, directory=".", method=PLURALITY,
+                      source=LOG_SOURCE, **options):
+    """Count only votes missing from the checkpoint ledger and return the cumulative tally.
+
+    ``processed`` in the result is the number of new votes handled by this call;
+    ``full=True`` discards the checkpoint and recounts everything. For ranked
+    and approval elections the ledger keeps every ballot and the whole set is
+    re-tabulated, adding ``rounds``, ``order`` and ``winner`` to the result.
+    ``vote_flags`` maps every counted vote id to its rejection reason, or None
+    when it was valid. ``source`` names the store the vote ids come from
+    (see vote_source); packing per-file votes into the log renumbers them, so
+    a checkpoint from the other store is discarded and everything recounted.
+    """
+    ledger = TallyLedger.load(session_code, candidates, directory, method, source)
+    if full:
+        ledger.reset()
+    tally = count_votes(ledger.unprocessed(votes), key_string, session_code, candidates,
+                        index=ledger.index, method=method, **options)
+    ledger.record(tally)
+    ledger.save()
+    result = {
+        "method": method,
+        "vote_counts": dict(ledger.vote_counts),
+        "total_votes": ledger.total_votes,
+        "invalid_votes": ledger.invalid_votes,
+        "invalid_reasons": dict(ledger.invalid_reasons),
+        "errors": tally["errors"],
+        "processed": tally["processed"],
+        "vote_flags": ledger.vote_flags(),
+    }
+    if method != PLURALITY:
+        outcome = tabulate(method, ledger.rankings, candidates)
+        result.update(vote_counts=outcome["vote_counts"], rounds=outcome["rounds"], order=outcome["order"],
+                      winner=outcome["winner"])
+    return result
+
+
+def count_sessions(jobs, workers=None, **options):
+    """Count several elections at once.
+
+    ``jobs`` is a list of (config, votes, directory, source). Each election
+    runs on its own thread with an equal share of the worker processes, and
+    keeps its own checkpoint in ``directory``. Returns tallies in job order.
+    """
+    if not jobs:
+        return []
+    workers = workers or os.cpu_count() or 1
+    share = max(1, workers // len(jobs))
+    with ThreadPoolExecutor(len(jobs)) as pool:
+        futures = [
+            pool.submit(count_incremental, votes, config["key"], config["session_code"], config["candidates"],
+                        directory=directory, workers=share, method=config.get("method", PLURALITY), source=source,
+                        **options)
+            for config, votes, directory, source in jobs
+        ]
+        return [future.result() for future in futures]
+
+
+def load_election_dir(directory):
+    """Read an election directory: election_config.json plus its vote log"""
+    election = Election(directory)
+    return election.load_config(), election.vote_reader().scan()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decrypt, validate, count and rank elections without the GUI")
+    parser.add_argument("elections", nargs="*",
+                        help="election directories (election_config.json + vote_log/); "
+                             "default is the current election from ConfigManager")
+    parser.add_argument("--registry", help="count every election in this registry directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="votes per worker task")
+    parser.add_argument("--save", action="store_true", help="save the results with each election")
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and recount every vote")
+    parser.add_argument("--log-dir", default=DEFAULT_DIRECTORY, help="vote log directory for the current election")
+    parser.add_argument("--format", choices=FORMATS, default="text", help="output format")
+    parser.add_argument("--output", help="write to this file instead of stdout (one election only)")
+    args = parser.parse_args()
+    if args.registry:
+        registry = ElectionRegistry(args.registry)
+        args.elections += [registry.path(config["session_code"]) for config in registry.sessions()]
+    if args.output and len(args.elections) > 1:
+        parser.error("--output takes a single election")
+
+    jobs = []
+    if args.elections:
+        for directory in args.elections:
+            config, votes = load_election_dir(directory)
+            jobs.append((config, votes, directory, LOG_SOURCE))
+    else:
+        from config_manager import ConfigManager
+
+        config_manager = ConfigManager()
+        config = config_manager.load_election_config()
+        if not config:
+            parser.error("Election configuration not found!")
+        jobs.append((config, load_votes(config_manager, args.log_dir), ".", vote_source(config_manager, args.log_dir)))
+
+    tallies = count_sessions(jobs, workers=args.workers, full=args.full, chunk_size=args.chunk_size)
+    for (config, _, directory, _), tally in zip(jobs, tallies):
+        for vote_id, error in tally["errors"]:
+            print(f"Error processing {vote_id}: {error}", file=sys.stderr)
+        report = build_report(config["session_code"], tally)
+        if args.save:
+            if args.elections:
+                Election(directory).save_results(report, tally["vote_flags"])
+            else:
+                config_manager.save_results(config["session_code"], tally["total_votes"], tally["vote_counts"])
+        if args.output:
+            write_report(report, args.output, args.format)
+        else:
+            sys.stdout.write(render(report, args.format))
+
+
+if __name__ == "__main__":
+    main()
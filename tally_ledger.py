@@ -0,0 +1,115 @@
+"""
+Tally Ledger
+Checkpoint of already-counted votes so a recount only decrypts new arrivals
+"""
+
+import json
+import os
+
+from tabulation import PLURALITY
+from vote_validation import REASONS, DedupIndex
+
+
+def checkpoint_path(session_code, directory="."):
+    return os.path.join(directory, f"tally_checkpoint_{session_code}.json")
+
+
+class TallyLedger:
+    """Running tally plus the ids of every vote that has been folded into it"""
+
+    def __init__(self, session_code, candidates, path, method=PLURALITY, source=None):
+        self.session_code = session_code
+        self.candidates = list(candidates)
+        self.path = path
+        self.method = method
+        # Vote ids only mean something within one store (file names vs log
+        # offsets), so a checkpoint taken against the other store is stale.
+        self.source = source
+        self.processed = set()
+        self.vote_counts = {candidate: 0 for candidate in self.candidates}
+        self.total_votes = 0
+        self.invalid_votes = 0
+        self.invalid_reasons = {reason: 0 for reason in REASONS}
+        self.index = DedupIndex()
+        # Ranked/approval ballots as tuples of candidate indices; re-tabulated after every count.
+        self.rankings = []
+        # Vote id -> rejection reason; every other processed id was counted.
+        self.rejected = {}
+        self._pending = []
+
+    @classmethod
+    def load(cls, session_code, candidates, directory=".", method=PLURALITY, source=None):
+        """Open the checkpoint for this election, starting fresh if it is missing or stale"""
+        ledger = cls(session_code, candidates, checkpoint_path(session_code, directory), method, source)
+        try:
+            with open(ledger.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return ledger
+        if (data.get("session_code") != session_code or data.get("candidates") != ledger.candidates
+                or data.get("method", PLURALITY) != method or data.get("source") != source):
+            return ledger
+        ledger.processed = set(data["processed"])
+        ledger.vote_counts.update(data["vote_counts"])
+        ledger.total_votes = data["total_votes"]
+        ledger.invalid_votes = data["invalid_votes"]
+        ledger.invalid_reasons.update(data.get("invalid_reasons", {}))
+        ledger.index = DedupIndex(data.get("digests", ()), data.get("ballot_ids", ()))
+        ledger.rankings = [tuple(ranking) for ranking in data.get("rankings", ())]
+        ledger.rejected = dict(data.get("rejected", {}))
+        return ledger
+
+    def unprocessed(self, votes):
+        """Yield only (vote_id, encrypted_data) pairs not counted yet, remembering their ids"""
+        for vote_id, encrypted_data in votes:
+            if vote_id not in self.processed:
+                self._pending.append(vote_id)
+                yield vote_id, encrypted_data
+
+    def record(self, tally):
+        """Fold a tally of the votes yielded by unprocessed() into the running totals"""
+        for candidate, votes in tally["vote_counts"].items():
+            self.vote_counts[candidate] = self.vote_counts.get(candidate, 0) + votes
+        self.total_votes += tally["total_votes"]
+        self.invalid_votes += tally["invalid_votes"]
+        for reason, count in tally["invalid_reasons"].items():
+            self.invalid_reasons[reason] = self.invalid_reasons.get(reason, 0) + count
+        self.rankings.extend(tally.get("rankings", ()))
+        self.rejected.update(tally.get("rejected", ()))
+        self.processed.update(self._pending)
+        self._pending = []
+
+    def save(self):
+        """Write the checkpoint atomically so a crash never leaves a half-written ledger"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "session_code": self.session_code,
+                "candidates": self.candidates,
+                "method": self.method,
+                "source": self.source,
+                "processed": sorted(self.processed),
+                "vote_counts": self.vote_counts,
+                "total_votes": self.total_votes,
+                "invalid_votes": self.invalid_votes,
+                "invalid_reasons": self.invalid_reasons,
+                # The dedup index persists too, so a replay arriving after
+                # a checkpoint is still rejected.
+                "digests": sorted(self.index.digests),
+                "ballot_ids": sorted(self.index.ballot_ids),
+                "rankings": self.rankings,
+                "rejected": self.rejected,
+            }, f)
+        os.replace(tmp, self.path)
+
+    def vote_flags(self):
+        """{vote_id: reason or None} for every processed vote"""
+        return {vote_id: self.rejected.get(vote_id) for vote_id in self.processed}
+
+    def reset(self):
+        """Forget the checkpoint so the next count starts from scratch"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.__init__(self.session_code, self.candidates, self.path, self.method, self.source)
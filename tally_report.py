@@ -0,0 +1,146 @@
+"""
+Tally Report
+Ranking, result formatting and JSON/CSV/text export for a counted election
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+FORMATS = ("text", "json", "csv")
+METHOD_NAMES = {"plurality": "First past the post", "approval": "Approval", "irv": "Instant runoff (ranked choice)"}
+
+
+def rank(vote_counts, total_votes, order=None):
+    """Candidates ordered by votes (or by ``order``, e.g. runoff finishing order), with rank and percentage of valid votes"""
+    if order is not None:
+        ordered = [(candidate, vote_counts[candidate]) for candidate in order]
+    else:
+        ordered = sorted(vote_counts.items(), key=lambda x: x[1], reverse=True)
+    return [
+        {
+            "rank": i,
+            "candidate": candidate,
+            "votes": votes,
+            "percentage": round((votes / total_votes * 100) if total_votes > 0 else 0, 2),
+        }
+        for i, (candidate, votes) in enumerate(ordered, 1)
+    ]
+
+
+def build_report(session_code, tally, timestamp=None):
+    """Machine-readable summary of a tally from tally_engine"""
+    ranking = rank(tally["vote_counts"], tally["total_votes"], tally.get("order"))
+    if "winner" in tally:
+        winner = tally["winner"]
+    else:
+        winner = ranking[0]["candidate"] if ranking and ranking[0]["votes"] > 0 else None
+    report = {
+        "session_code": session_code,
+        "timestamp": (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+        "method": tally.get("method", "plurality"),
+        "total_votes": tally["total_votes"],
+        "invalid_votes": tally["invalid_votes"],
+        "invalid_reasons": dict(tally.get("invalid_reasons", {})),
+        "ranking": ranking,
+        "winner": winner,
+    }
+    if "rounds" in tally:
+        report["rounds"] = tally["rounds"]
+    return report
+
+
+def format_header(report):
+    lines = [
+        "=" * 70,
+        " " * 20 + "ELECTION RESULTS",
+        "=" * 70,
+        "",
+        f"Session Code: {report['session_code']}",
+        f"Timestamp: {report['timestamp']}",
+        f"Total Valid Votes: {report['total_votes']}",
+    ]
+    method = report.get("method", "plurality")
+    if method != "plurality":
+        lines.insert(6, f"Method: {METHOD_NAMES.get(method, method)}")
+    if report["invalid_votes"] > 0:
+        lines.append(f"Invalid Votes: {report['invalid_votes']}")
+        for reason, count in report["invalid_reasons"].items():
+            if count:
+                lines.append(f"  - {reason.replace('_', ' ')}: {count}")
+    lines += ["", "=" * 70, "", ""]
+    return "\n".join(lines)
+
+
+def format_entry(entry):
+    return (
+        f"Rank {entry['rank']}: {entry['candidate']}\n"
+        f"       Votes: {entry['votes']} ({entry['percentage']:.2f}%)\n"
+        f"       {'█' * int(entry['percentage'] / 2)}\n\n"
+    )
+
+
+def format_rounds(report):
+    """Round-by-round counts for runoff reports; empty for single-round methods"""
+    rounds = report.get("rounds") or []
+    if len(rounds) < 2:
+        return ""
+    lines = ["-" * 70, "ROUND BY ROUND", "-" * 70]
+    for entry in rounds:
+        lines.append(f"Round {entry['round']}:")
+        for candidate, votes in sorted(entry["counts"].items(), key=lambda x: x[1], reverse=True):
+            lines.append(f"    {candidate}: {votes}")
+        lines.append(f"    (exhausted ballots: {entry['exhausted']})")
+        if entry["eliminated"]:
+            moved = ", ".join(f"{votes} to {name}" for name, votes in entry["transfers"].items())
+            lines.append(f"    Eliminated {entry['eliminated']}" + (f"; transferred {moved}" if moved else ""))
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def format_footer(report):
+    if not report["winner"]:
+        return ""
+    winner_votes = report["ranking"][0]["votes"]
+    return (
+        "=" * 70 + "\n"
+        f"{'🏆 WINNER 🏆':^70}\n"
+        f"{report['winner']:^70}\n"
+        f"{'with ' + str(winner_votes) + ' votes':^70}\n"
+        + "=" * 70 + "\n"
+    )
+
+
+def format_text(report):
+    """The human-readable results sheet shown in the admin GUI"""
+    return (format_header(report) + "".join(format_entry(e) for e in report["ranking"])
+            + format_rounds(report) + format_footer(report))
+
+
+def format_json(report):
+    return json.dumps(report, indent=2, ensure_ascii=False) + "\n"
+
+
+def format_csv(report):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["session_code", "rank", "candidate", "votes", "percentage"])
+    for entry in report["ranking"]:
+        writer.writerow([report["session_code"], entry["rank"], entry["candidate"], entry["votes"], entry["percentage"]])
+    return out.getvalue()
+
+
+def render(report, fmt):
+    if fmt == "json":
+        return format_json(report)
+    if fmt == "csv":
+        return format_csv(report)
+    if fmt == "text":
+        return format_text(report)
+    raise ValueError(f"unknown format: {fmt}")
+
+
+def write_report(report, path, fmt):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(render(report, fmt))
@@ -0,0 +1,39 @@
+import pytest
+
+crypto_handler = pytest.importorskip("crypto_handler")
+
+from tally_engine import count_votes
+from vote_log import VoteLogReader, VoteLogWriter
+
+
+def _log_with_replays(directory, crypto, key):
+    """Every ballot id is cast for A, then replayed for B about twenty votes (a few chunks) later"""
+    votes = []
+    for ballot in range(310):
+        if ballot < 300:
+            votes.append((ballot, "A"))
+        if ballot >= 10:
+            votes.append((ballot - 10, "B"))
+    writer = VoteLogWriter(str(directory), fsync=False)
+    try:
+        for n, (ballot, choice) in enumerate(votes):
+            writer.append(crypto.encrypt_vote({"session_code": "S", "vote": choice, "ballot_id": ballot, "n": n}, key))
+    finally:
+        writer.close()
+    return VoteLogReader(str(directory))
+
+
+def test_replays_count_the_same_with_any_number_of_workers(tmp_path):
+    crypto = crypto_handler.CryptoHandler()
+    key = crypto.generate_key()
+    reader = _log_with_replays(tmp_path, crypto, key)
+    key_string = crypto.key_to_string(key)
+
+    tallies = [count_votes(reader.scan(), key_string, "S", ["A", "B"], workers=workers, chunk_size=7)
+               for workers in (1, 2, 4)]
+
+    for tally in tallies:
+        assert tally["vote_counts"] == tallies[0]["vote_counts"]
+        assert sorted(tally["rejected"]) == sorted(tallies[0]["rejected"])
+    assert tallies[0]["vote_counts"] == {"A": 300, "B": 0}
+    assert tallies[0]["invalid_reasons"]["duplicate_ballot"] == 300
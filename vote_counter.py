@@ -0,0 +1,108 @@
+"""
+Vote Counter
+Sharded vote counters so concurrent voters do not all update the same nominee row
+"""
+
+import random
+import threading
+
+
+class TallyVersion:
+    """Counter bumped after every committed change to the tallies"""
+
+    def __init__(self):
+        self.value = 0
+        self._changed = threading.Condition()
+
+    def bump(self):
+        with self._changed:
+            self.value += 1
+            self._changed.notify_all()
+            return self.value
+
+    def wait_for_change(self, seen, timeout=None):
+        """Block until the version moves past ``seen`` or the timeout elapses; returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.value != seen, timeout)
+            return self.value
+
+
+tally_version = TallyVersion()
+
+
+def init_counter_schema(db):
+    """Create the shard table used to spread vote increments"""
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vote_shards (
+            nominee_id INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (nominee_id, shard),
+            FOREIGN KEY (nominee_id) REFERENCES nominees(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+    """
+    )
+
+
+def pick_shard(shards):
+    """Choose the shard row a single increment lands on"""
+    return random.randrange(max(1, shards))
+
+
+def record_votes(db, nominee_ids, shards):
+    """Add one vote to each nominee id; the caller owns the transaction"""
+    db.executemany(
+        """
+        INSERT INTO vote_shards (nominee_id, shard, votes) VALUES (?, ?, 1)
+        ON CONFLICT (nominee_id, shard) DO UPDATE SET votes = votes + 1
+    """,
+        [(nominee_id, pick_shard(shards)) for nominee_id in nominee_ids],
+    )
+
+
+def nominee_totals(db, category_id):
+    """Return (id, name, votes) rows for a category, summing every shard.
+
+    ``nominees.votes`` is still added in so tallies recorded before the
+    shard table existed keep counting.
+    """
+    return db.execute(
+        """
+        SELECT n.id, n.name, n.votes + COALESCE(SUM(s.votes), 0) AS votes
+        FROM nominees n
+        LEFT JOIN vote_shards s ON s.nominee_id = n.id
+        WHERE n.category_id = ?
+        GROUP BY n.id
+        ORDER BY n.id
+    """,
+        (category_id,),
+    ).fetchall()
+
+
+def results_snapshot(db):
+    """Build the per-category results with one grouped query"""
+    rows = db.execute(
+        """
+        SELECT c.id AS category_id, c.name AS category,
+               n.id AS nominee_id, n.name AS nominee,
+               n.votes + COALESCE(SUM(s.votes), 0) AS votes
+        FROM categories c
+        LEFT JOIN nominees n ON n.category_id = c.id
+        LEFT JOIN vote_shards s ON s.nominee_id = n.id
+        GROUP BY c.id, n.id
+        ORDER BY c.ordering, c.id, n.id
+    """
+    ).fetchall()
+    data = []
+    for row in rows:
+        if not data or data[-1]["category_id"] != row["category_id"]:
+            data.append({"category_id": row["category_id"], "category": row["category"], "total": 0, "nominees": []})
+        if row["nominee_id"] is not None:
+            data[-1]["nominees"].append({"id": row["nominee_id"], "name": row["nominee"], "votes": row["votes"]})
+            data[-1]["total"] += row["votes"]
+    for cat in data:
+        for n in cat["nominees"]:
+            pct = (n["votes"] / cat["total"] * 100) if cat["total"] > 0 else 0
+            n["pct"] = round(pct, 1)
+    return data
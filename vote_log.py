@@ -0,0 +1,278 @@
+"""
+Vote Log
+Segmented, length-prefixed append-only log of encrypted votes with an offset index
+
+Each segment ``segment-NNNNNN.log`` holds records of
+``[4-byte length][4-byte crc32][payload]`` and a matching ``.idx`` file holds
+one 8-byte offset per record. A vote id is ``"<segment>:<offset>"``. The
+``count`` file holds the number of appended votes so monitoring never has to
+look at the segments.
+
+Usage: python vote_log.py --session CODE [--registry elections] [--segment-mb 64]
+       python vote_log.py --directory DIR
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from a single process only
+    fcntl = None
+
+DEFAULT_DIRECTORY = "vote_log"
+HEADER = struct.Struct(">II")
+OFFSET = struct.Struct(">Q")
+COUNT_FILE = "count"
+
+
+def _segment_paths(directory, number):
+    base = os.path.join(directory, f"segment-{number:06d}")
+    return base + ".log", base + ".idx"
+
+
+def list_segments(directory):
+    """Segment numbers present in the directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith("segment-") and name.endswith(".log"):
+            numbers.append(int(name[len("segment-"):-len(".log")]))
+    return sorted(numbers)
+
+
+def create_log(directory=DEFAULT_DIRECTORY):
+    """Create an empty log with a zero count file, so its counter is authoritative from the start"""
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with open(os.path.join(directory, COUNT_FILE), "xb") as f:
+            f.write(OFFSET.pack(0))
+    except FileExistsError:
+        pass
+
+
+class VoteLogWriter:
+    """Appends encrypted votes, rolling to a new segment past max_segment_bytes"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_segment_bytes=64 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "append.lock"), "a")
+
+    def append(self, encrypted_data):
+        """Append one vote and return its vote id"""
+        if isinstance(encrypted_data, str):
+            encrypted_data = encrypted_data.encode()
+        record = HEADER.pack(len(encrypted_data), zlib.crc32(encrypted_data)) + encrypted_data
+        if fcntl:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            segments = list_segments(self.directory)
+            number = segments[-1] if segments else 1
+            log_path, idx_path = _segment_paths(self.directory, number)
+            self._recover_tail(log_path, idx_path)
+            if os.path.exists(log_path) and os.path.getsize(log_path) + len(record) > self.max_segment_bytes:
+                number += 1
+                log_path, idx_path = _segment_paths(self.directory, number)
+            with open(log_path, "ab") as log:
+                offset = log.tell()
+                log.write(record)
+                log.flush()
+                if self.fsync:
+                    os.fsync(log.fileno())
+            # The index is written after the record is durable, so every
+            # indexed offset points at a complete record.
+            with open(idx_path, "ab") as idx:
+                idx.write(OFFSET.pack(offset))
+                idx.flush()
+                if self.fsync:
+                    os.fsync(idx.fileno())
+            self._bump_count()
+        finally:
+            if fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        return f"{number}:{offset}"
+
+    def _recover_tail(self, log_path, idx_path):
+        """Repair the segment after a crashed append, under the append lock.
+
+        Complete records past the last indexed one are indexed (the crash hit
+        between the record and its index entry); the first torn or corrupt
+        record and everything after it is cut off, so new votes never land
+        behind a record that readers cannot get past.
+        """
+        if not os.path.exists(log_path):
+            return
+        size = os.path.getsize(log_path)
+        idx_size = os.path.getsize(idx_path) if os.path.exists(idx_path) else 0
+        whole = idx_size - idx_size % OFFSET.size
+        with open(log_path, "r+b") as log, open(idx_path, "a+b") as idx:
+            if whole != idx_size:
+                idx.truncate(whole)
+            end = 0
+            if whole:
+                idx.seek(whole - OFFSET.size)
+                (last,) = OFFSET.unpack(idx.read(OFFSET.size))
+                log.seek(last)
+                length, _ = HEADER.unpack(log.read(HEADER.size))
+                end = last + HEADER.size + length
+            if end >= size:
+                return
+            recovered = []
+            log.seek(end)
+            while end + HEADER.size <= size:
+                length, crc = HEADER.unpack(log.read(HEADER.size))
+                if end + HEADER.size + length > size:
+                    break
+                if zlib.crc32(log.read(length)) != crc:
+                    break
+                recovered.append(end)
+                end += HEADER.size + length
+            log.truncate(end)
+            idx.write(b"".join(OFFSET.pack(offset) for offset in recovered))
+            for f in (log, idx):
+                f.flush()
+                os.fsync(f.fileno())
+        if recovered:
+            self._bump_count(len(recovered))
+
+    def _bump_count(self, n=1):
+        # Called under the append lock, so the read-modify-write cannot race.
+        path = os.path.join(self.directory, COUNT_FILE)
+        with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), "r+b") as f:
+            raw = f.read(OFFSET.size)
+            count = OFFSET.unpack(raw)[0] if len(raw) == OFFSET.size else 0
+            f.seek(0)
+            f.write(OFFSET.pack(count + n))
+
+    def close(self):
+        self._lock_file.close()
+
+
+class VoteLogReader:
+    """Sequential, memory-mapped reads over every segment"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+
+    def exists(self):
+        return bool(list_segments(self.directory))
+
+    def count(self):
+        """Number of appended votes, read from the count file in O(1)"""
+        try:
+            with open(os.path.join(self.directory, COUNT_FILE), "rb") as f:
+                raw = f.read(OFFSET.size)
+        except FileNotFoundError:
+            raw = b""
+        if len(raw) == OFFSET.size:
+            return OFFSET.unpack(raw)[0]
+        return self.count_indexed()
+
+    def count_indexed(self):
+        """Number of indexed votes, from index file sizes; used when there is no count file"""
+        total = 0
+        for number in list_segments(self.directory):
+            _, idx_path = _segment_paths(self.directory, number)
+            if os.path.exists(idx_path):
+                total += os.path.getsize(idx_path) // OFFSET.size
+        return total
+
+    def scan(self):
+        """Yield (vote_id, encrypted_data) for every indexed record, in append order.
+
+        Records are located through the ``.idx`` offsets, so a corrupt record
+        is skipped without hiding the ones after it, and a record still being
+        appended (not indexed yet) is left for the next scan.
+        """
+        for number in list_segments(self.directory):
+            log_path, idx_path = _segment_paths(self.directory, number)
+            if os.path.getsize(log_path) == 0 or not os.path.exists(idx_path):
+                continue
+            with open(idx_path, "rb") as f:
+                index = f.read()
+            index = index[:len(index) - len(index) % OFFSET.size]
+            with open(log_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = len(data)
+                for (offset,) in OFFSET.iter_unpack(index):
+                    start = offset + HEADER.size
+                    if start > end:
+                        break
+                    length, crc = HEADER.unpack_from(data, offset)
+                    if start + length > end:
+                        break
+                    payload = data[start:start + length]
+                    if zlib.crc32(payload) != crc:
+                        continue  # corrupt record; later indexed records are still intact
+                    yield f"{number}:{offset}", payload
+
+    def read(self, vote_id):
+        """Random access to one vote by id"""
+        number, offset = (int(part) for part in vote_id.split(":"))
+        log_path, _ = _segment_paths(self.directory, number)
+        with open(log_path, "rb") as f:
+            f.seek(offset)
+            length, crc = HEADER.unpack(f.read(HEADER.size))
+            payload = f.read(length)
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise ValueError(f"corrupt vote record {vote_id}")
+        return payload
+
+
+def pack_votes(votes, directory=DEFAULT_DIRECTORY, max_segment_bytes=64 * 1024 * 1024):
+    """Append (filename, encrypted_data) pairs to a new log; returns how many were packed"""
+    if VoteLogReader(directory).exists():
+        raise FileExistsError(f"vote log in '{directory}' is not empty")
+    writer = VoteLogWriter(directory, max_segment_bytes, fsync=False)
+    packed = 0
+    try:
+        for _, encrypted_data in votes:
+            writer.append(encrypted_data)
+            packed += 1
+    finally:
+        writer.close()
+    # One fsync per segment at the end instead of one per vote.
+    for number in list_segments(directory):
+        for path in _segment_paths(directory, number):
+            with open(path, "rb+") as f:
+                os.fsync(f.fileno())
+    return packed
+
+
+def main():
+    from config_manager import ConfigManager
+
+    parser = argparse.ArgumentParser(description="Pack per-file encrypted votes into a segmented vote log")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--session", help="election the per-file votes belong to; packs into its vote log")
+    target.add_argument("--directory", help="pack into this vote log directory instead")
+    parser.add_argument("--registry", default="elections", help="election registry directory (with --session)")
+    parser.add_argument("--segment-mb", type=int, default=64, help="maximum segment size in MiB")
+    args = parser.parse_args()
+
+    config_manager = ConfigManager()
+    directory = args.directory
+    if args.session:
+        from election_registry import ElectionRegistry
+
+        # The per-file store is shared; it only holds votes for the election in ConfigManager's config.
+        config = config_manager.load_election_config() or {}
+        if config.get("session_code") != args.session:
+            parser.error(f"the per-file votes belong to session {config.get('session_code')!r}, not {args.session!r}")
+        directory = ElectionRegistry(args.registry).import_config(config).vote_log_dir
+
+    try:
+        packed = pack_votes(config_manager.load_all_votes(), directory, args.segment_mb * 1024 * 1024)
+    except FileExistsError as e:
+        parser.error(str(e))
+    print(f"Packed {packed} votes into {directory}")
+
+
+if __name__ == "__main__":
+    main()
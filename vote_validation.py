@@ -0,0 +1,79 @@
+"""
+Vote Validation
+Classifies decrypted votes and rejects duplicated or replayed ballots during the counting pass
+"""
+
+import hashlib
+
+DECRYPT_FAILED = "decrypt_failed"
+MALFORMED = "malformed"
+WRONG_SESSION = "wrong_session"
+UNKNOWN_CANDIDATE = "unknown_candidate"
+DUPLICATE_PAYLOAD = "duplicate_payload"
+DUPLICATE_BALLOT = "duplicate_ballot"
+
+REASONS = (DECRYPT_FAILED, MALFORMED, WRONG_SESSION, UNKNOWN_CANDIDATE, DUPLICATE_PAYLOAD, DUPLICATE_BALLOT)
+
+
+def payload_digest(encrypted_data):
+    """Short digest of the encrypted bytes; identical re-submissions share it"""
+    if isinstance(encrypted_data, str):
+        encrypted_data = encrypted_data.encode()
+    return hashlib.blake2b(encrypted_data, digest_size=16).hexdigest()
+
+
+def classify(vote_data, session_code, candidates):
+    """Return (candidate, None) for a countable vote or (None, reason)"""
+    if not isinstance(vote_data, dict) or "session_code" not in vote_data or "vote" not in vote_data:
+        return None, MALFORMED
+    if vote_data["session_code"] != session_code:
+        return None, WRONG_SESSION
+    candidate = vote_data["vote"]
+    if not isinstance(candidate, str):
+        return None, MALFORMED
+    if candidate not in candidates:
+        return None, UNKNOWN_CANDIDATE
+    return candidate, None
+
+
+def classify_ballot(vote_data, session_code, candidate_index):
+    """Return (tuple of candidate indices, None) for a countable ranked/approval ballot or (None, reason).
+
+    The choices come from ``ranking`` (preference order) or ``approvals``; a
+    plain ``vote`` counts as a ranking of one.
+    """
+    if not isinstance(vote_data, dict) or "session_code" not in vote_data:
+        return None, MALFORMED
+    if vote_data["session_code"] != session_code:
+        return None, WRONG_SESSION
+    choices = vote_data.get("ranking", vote_data.get("approvals"))
+    if choices is None and "vote" in vote_data:
+        choices = [vote_data["vote"]]
+    if not isinstance(choices, list) or not choices or len(set(map(str, choices))) != len(choices):
+        return None, MALFORMED
+    try:
+        return tuple(candidate_index[choice] for choice in choices), None
+    except (KeyError, TypeError):
+        return None, UNKNOWN_CANDIDATE
+
+
+class DedupIndex:
+    """Hash sets of payload digests and ballot ids already counted"""
+
+    def __init__(self, digests=(), ballot_ids=()):
+        self.digests = set(digests)
+        self.ballot_ids = set(ballot_ids)
+
+    def first_payload(self, digest):
+        """True the first time a payload digest is seen"""
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+    def first_ballot(self, ballot_id):
+        """True the first time a ballot id is seen"""
+        if ballot_id in self.ballot_ids:
+            return False
+        self.ballot_ids.add(ballot_id)
+        return True